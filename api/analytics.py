@@ -0,0 +1,152 @@
+"""Cross-chain statistics of prices, vectorised over PriceColumns: how many chains
+sell every code, and the spread of every code's prices. Everything is done with
+sorts and grouped reductions, so millions of item instances take seconds.
+"""
+
+import numpy as np
+
+from constants import *
+from file_server import FileServer
+from file_cache import FileCache
+from parser import Parser
+from price_columns import CodeTable, PriceColumns
+
+
+class PriceStatistics:
+    """Per code statistics of the prices of item instances, across all the stores
+    (and so chains) selling the code. Arrays are aligned with `code`, the code ids.
+    """
+
+    def __init__(
+        self,
+        code: np.ndarray,
+        count: np.ndarray,
+        minimum: np.ndarray,
+        median: np.ndarray,
+        maximum: np.ndarray,
+        mean: np.ndarray,
+        std: np.ndarray,
+    ) -> None:
+        self.code = code
+        self.count = count
+        self.minimum = minimum
+        self.median = median
+        self.maximum = maximum
+        self.mean = mean
+        self.std = std
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+    @property
+    def coefficient_of_variation(self) -> np.ndarray:
+        """The standard deviation relative to the mean, comparable across codes."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.std / self.mean
+
+    @property
+    def spread(self) -> np.ndarray:
+        """How many times the most expensive price is the cheapest."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.maximum / self.minimum
+
+
+def row_chains(columns: PriceColumns) -> tuple[np.ndarray, list[str]]:
+    """Returns the chain index of every row, and the chain ids by index."""
+    chain_indexes = {}
+    store_chain = np.array(
+        [
+            chain_indexes.setdefault(chain_id, len(chain_indexes))
+            for chain_id, _, _ in columns.stores
+        ],
+        dtype=np.int32,
+    )
+
+    return store_chain[columns.store], list(chain_indexes)
+
+
+def chains_per_code(columns: PriceColumns) -> np.ndarray:
+    """Returns the number of chains selling every code, indexed by code id."""
+    chains, chain_ids = row_chains(columns)
+
+    # every (code, chain) pair as a single int, sorted to drop the repeated pairs.
+    # (np.unique hashes ints, which is many times slower than sorting them)
+    pairs = np.sort(columns.code.astype(np.int64) * len(chain_ids) + chains)
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    pairs = pairs[first]
+
+    return np.bincount(pairs // len(chain_ids), minlength=len(columns.codes))
+
+
+def overlap_histogram(columns: PriceColumns, *, cumulative: bool = True) -> np.ndarray:
+    """Returns the number of codes sold by k chains, at index k, or by at least k
+    chains if `cumulative`. Codes of the code table which are not in the columns
+    count as sold by 0 chains.
+    """
+    histogram = np.bincount(chains_per_code(columns))
+    if cumulative:
+        histogram = np.cumsum(histogram[::-1])[::-1]
+
+    return histogram
+
+
+def price_statistics(columns: PriceColumns) -> PriceStatistics:
+    """Returns the min, median, max, mean and standard deviation of every code's
+    prices. Rows without a price are ignored.
+    """
+    valid = ~np.isnan(columns.price)
+    code, price = columns.code[valid], columns.price[valid]
+
+    # sorted by code, then price, so every code is a run of ascending prices. sorting
+    # by a single int of the code and the price's rank is much faster than lexsort.
+    rank = np.empty(len(price), np.int64)
+    rank[np.argsort(price)] = np.arange(len(price))
+    order = np.argsort(code.astype(np.int64) * len(price) + rank)
+    code, price = code[order], price[order]
+
+    if len(code) == 0:
+        empty = np.empty(0)
+        return PriceStatistics(code, np.empty(0, np.int64), *[empty] * 5)
+
+    starts = np.flatnonzero(np.r_[True, code[1:] != code[:-1]])
+    count = np.diff(np.r_[starts, len(code)])
+
+    # grouped sums over the runs of the codes
+    mean = np.add.reduceat(price, starts) / count
+    deviations = (price - np.repeat(mean, count)) ** 2
+    std = np.sqrt(np.add.reduceat(deviations, starts) / count)
+
+    return PriceStatistics(
+        code[starts],
+        count,
+        price[starts],
+        # the middle price, or the mean of the two middle prices
+        (price[starts + (count - 1) // 2] + price[starts + count // 2]) / 2,
+        price[starts + count - 1],
+        mean,
+        std,
+    )
+
+
+if __name__ == "__main__":
+    # how many codes are sold by at least k chains, in the chains' latest full prices files
+    cache = FileCache()
+    servers = {
+        server_type: FileServer(server_type, cache=cache) for server_type in SERVER_TYPE
+    }
+    parser = Parser()
+    codes = CodeTable()
+
+    columns_list = []
+    for chain in CHAIN:
+        server = servers[CHAINS_DATA[chain]["server"]["type"]]
+        try:
+            for file in server.get_files(chain, FILE_CATEGORY.PricesFull, 1):
+                columns_list.append(parser.parse_columns(file, codes))
+        except Exception as e:
+            print(f"Skipping {chain.name}: {e}")
+
+    columns = PriceColumns.concatenate(columns_list)
+    for k, amount in enumerate(overlap_histogram(columns)):
+        print(f"{k}: number of products is {amount}")
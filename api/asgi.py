@@ -0,0 +1,213 @@
+"""The prices API as a plain ASGI application, served by any ASGI server, e.g.
+`uvicorn asgi:app`. Same routes, responses and caching as the Flask server, but
+requests are handled on an event loop with the async database driver, and exports
+are streamed.
+"""
+
+import asyncio
+from urllib.parse import parse_qsl
+
+from constants import CHAIN, CHAINS_DATA, PRICES_UPDATED_CHANNEL
+from database import AsyncDatabase
+from prices_api import (
+    EXPORT_FORMATS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    encode_export_header,
+    encode_export_rows,
+    encode_prices_page,
+    parse_export_arguments,
+    parse_prices_arguments,
+    prices_query_arguments,
+)
+from response_cache import ResponseCache
+from utils import BATCH_SIZE, gzip_compressor
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET"),
+    (b"access-control-allow-headers", b"Content-Type"),
+    (b"access-control-allow-credentials", b"true"),
+]
+
+cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] != "http":
+        return
+
+    route = ROUTES.get(scope["path"])
+    if route is None:
+        await send_error(send, 404, "Not found")
+    elif scope["method"] == "OPTIONS":
+        # a CORS preflight, answered by the CORS headers every response has
+        await send_start(send, 204, [])
+        await send({"type": "http.response.body", "body": b""})
+    elif scope["method"] != "GET":
+        await send_error(send, 405, "Method not allowed")
+    else:
+        await route(scope, send)
+
+
+async def lifespan(receive, send):
+    listener = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            listener = asyncio.create_task(listen_for_ingests())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if listener is not None:
+                listener.cancel()
+            await AsyncDatabase.close_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def listen_for_ingests():
+    """Empties the response cache whenever an ingest commits new prices."""
+    while True:
+        try:
+            async for _ in AsyncDatabase.listen(PRICES_UPDATED_CHANNEL):
+                cache.invalidate()
+        except Exception:
+            # whatever was committed meanwhile would be missed
+            cache.invalidate()
+            await asyncio.sleep(5)
+
+
+async def send_start(send, status: int, headers: list[tuple[bytes, bytes]]):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [*headers, *CORS_HEADERS],
+        }
+    )
+
+
+async def send_error(send, status: int, description: str):
+    await send_start(send, status, [(b"content-type", b"text/plain; charset=utf-8")])
+    await send({"type": "http.response.body", "body": description.encode()})
+
+
+def get_header(scope, name: bytes) -> bytes | None:
+    return next((value for key, value in scope["headers"] if key == name), None)
+
+
+def get_arguments(scope) -> dict:
+    return dict(parse_qsl(scope["query_string"].decode()))
+
+
+def etag_matches(scope, etag: str) -> bool:
+    """Returns wether the request's If-None-Match lists the (strong) etag."""
+    if_none_match = get_header(scope, b"if-none-match")
+    if if_none_match is None:
+        return False
+
+    tags = {tag.strip() for tag in if_none_match.split(b",")}
+    quoted = f'"{etag}"'.encode()
+
+    return bool(tags & {b"*", quoted, b"W/" + quoted})
+
+
+def accepts_gzip(scope) -> bool:
+    for encoding in (get_header(scope, b"accept-encoding") or b"").split(b","):
+        name, _, parameters = encoding.partition(b";")
+        if name.strip() not in (b"gzip", b"*"):
+            continue
+
+        _, _, quality = parameters.partition(b"q=")
+        try:
+            return float(quality or 1) > 0
+        except ValueError:
+            return False
+
+    return False
+
+
+async def get_prices(scope, send):
+    try:
+        arguments = parse_prices_arguments(get_arguments(scope))
+    except ValueError as e:
+        await send_error(send, 400, str(e))
+        return
+
+    # the normalised query, so equivalent requests share an entry
+    key = (scope["path"], *arguments.values())
+    cached = cache.get(key)
+    if cached is not None:
+        body, etag = cached
+    else:
+        generation = cache.generation
+        # a page is at most MAX_PAGE_SIZE rows, so it is encoded whole, like in the
+        # Flask server, and sent with its etag
+        async with AsyncDatabase() as db:
+            rows = [
+                row
+                async for row in db.iterate_prices(**prices_query_arguments(arguments))
+            ]
+
+        body = encode_prices_page(arguments, rows)
+        etag = cache.put(key, body, generation)
+
+    # clients revalidate with If-None-Match and get 304 while nothing changed
+    headers = [(b"etag", f'"{etag}"'.encode()), (b"cache-control", b"no-cache")]
+    if etag_matches(scope, etag):
+        await send_start(send, 304, headers)
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    await send_start(send, 200, [(b"content-type", b"application/json"), *headers])
+    await send({"type": "http.response.body", "body": body})
+
+
+async def export_prices(scope, send):
+    """Streams all the current prices of a chain, as NDJSON or CSV."""
+    try:
+        chain, format = parse_export_arguments(get_arguments(scope))
+    except ValueError as e:
+        await send_error(send, 400, str(e))
+        return
+
+    headers = [
+        (b"content-type", EXPORT_FORMATS[format].encode()),
+        (b"content-disposition", f"attachment; filename={chain}.{format}".encode()),
+    ]
+    compressor = None
+    if accepts_gzip(scope):
+        compressor = gzip_compressor()
+        headers += [(b"content-encoding", b"gzip"), (b"vary", b"Accept-Encoding")]
+
+    async def send_chunk(chunk: bytes, more_body: bool = True):
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+            if not more_body:
+                chunk += compressor.flush()
+
+        if chunk or not more_body:
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+
+    await send_start(send, 200, headers)
+    await send_chunk(encode_export_header(format))
+
+    # rows come from a server side cursor, so memory use does not grow
+    async with AsyncDatabase() as db:
+        batch = []
+        async for row in db.iterate_prices(chain_id=CHAINS_DATA[CHAIN[chain]]["id"]):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                await send_chunk(encode_export_rows(batch, format))
+                batch = []
+
+    await send_chunk(encode_export_rows(batch, format), more_body=False)
+
+
+ROUTES = {"/api/prices": get_prices, "/api/prices/export": export_prices}
@@ -0,0 +1,673 @@
+import asyncio
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import IO
+from weakref import WeakKeyDictionary
+import aiohttp
+import json
+import time
+
+from constants import SERVER_TYPE, SERVER_TYPE_DATA, FILE_CATEGORY, CHAIN, CHAINS_DATA
+from data_file import DataFile
+from file_server import (
+    FileServer,
+    FileServerCerberus,
+    FileServerShufersal,
+    FileServerSuperPharm,
+    FileServerNibit,
+    FileServerBinaProjects,
+)
+from file_cache import FileCache
+from watermarks import Watermarks
+from utils import CHUNK_SIZE, spooled_file
+
+
+class AsyncFileServer(FileServer):
+    """Asyncio counterpart of FileServer.
+    The server must be entered as an async context manager, which owns its HTTP session:
+
+        async with AsyncFileServer(SERVER_TYPE.Cerberus) as server:
+            files = await server.get_files(CHAIN.DorAlon, FILE_CATEGORY.PricesFull, 1)
+
+    Parsing of listings is inherited from the synchronous server of the same type,
+    only the methods that make requests are overridden as coroutines. The synchronous
+    methods without a counterpart raise a TypeError.
+    """
+
+    # bounds the parallel downloads from each server type, across all instances.
+    # a semaphore belongs to the event loop it is used in, so there is a set per loop
+    download_slots: WeakKeyDictionary = WeakKeyDictionary()
+
+    def __new__(
+        cls,
+        type: SERVER_TYPE,
+        concurrent: bool = True,
+        cache: FileCache = None,
+        watermarks: Watermarks = None,
+    ) -> "AsyncFileServer":
+        match type:
+            case SERVER_TYPE.Cerberus:
+                return object.__new__(AsyncFileServerCerberus)
+            case SERVER_TYPE.Shufersal:
+                return object.__new__(AsyncFileServerShufersal)
+            case SERVER_TYPE.SuperPharm:
+                return object.__new__(AsyncFileServerSuperPharm)
+            case SERVER_TYPE.Nibit:
+                return object.__new__(AsyncFileServerNibit)
+            case SERVER_TYPE.BinaProjects:
+                return object.__new__(AsyncFileServerBinaProjects)
+            case _:
+                raise ValueError(f"Unsupported server type: {type}")
+
+    def __init__(
+        self,
+        type: SERVER_TYPE,
+        concurrent: bool = True,
+        cache: FileCache = None,
+        watermarks: Watermarks = None,
+    ) -> None:
+        self.type = type
+        self.concurrent = concurrent
+        self.cache = cache
+        self.watermarks = watermarks or FileServer.get_default_watermarks()
+
+        self.server_data = SERVER_TYPE_DATA[type]
+        self.base_url = self.server_data["metadata"]["domain"]
+        self.session: aiohttp.ClientSession = None
+
+    async def __aenter__(self) -> "AsyncFileServer":
+        pool = self.server_data["metadata"]["connection_pool"]
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=pool["hosts"] * pool["connections_per_host"],
+                limit_per_host=pool["connections_per_host"],
+            ),
+            # auth cookies are passed explicitly, like in the synchronous servers
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.session.close()
+
+        return False  # dont suppress exceptions
+
+    @staticmethod
+    def get_download_slot(type: SERVER_TYPE) -> asyncio.Semaphore:
+        """Returns the download semaphore of the server type in the running loop,
+        created on first use.
+        """
+        slots = AsyncFileServer.download_slots.setdefault(
+            asyncio.get_running_loop(), {}
+        )
+        slot = slots.get(type)
+        if slot is None:
+            slot = asyncio.Semaphore(
+                SERVER_TYPE_DATA[type]["metadata"]["max_concurrent_downloads"]
+            )
+            slots[type] = slot
+
+        return slot
+
+    @staticmethod
+    def check_response(res: aiohttp.ClientResponse):
+        """Throws if the response is not OK. Should be called after every request."""
+        if not res.ok:
+            raise Exception(
+                f"CODE {res.status}: {res.method} to {res.url} failed: {res.reason}"
+            )
+
+    @staticmethod
+    def get_cookie(res: aiohttp.ClientResponse, name: str) -> str | None:
+        """Returns a cookie set by the response or by one of its redirects."""
+        for response in (res, *reversed(res.history)):
+            morsel = response.cookies.get(name)
+            if morsel is not None:
+                return morsel.value
+
+        return None
+
+    async def fetch(
+        self,
+        method: str,
+        url: str,
+        *,
+        check: bool = True,
+        file: IO[bytes] = None,
+        **kwargs,
+    ) -> aiohttp.ClientResponse:
+        """Sends a request and reads its whole body, so the connection is released
+        back to the pool while the response stays usable.
+        If `file` is given, the body is streamed into it (overwriting it) instead.
+        """
+        async with self.session.request(method, url, **kwargs) as res:
+            if file is None:
+                await res.read()
+            else:
+                file.seek(0)
+                file.truncate()
+                async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+                    file.write(chunk)
+                file.seek(0)
+
+        if check:
+            AsyncFileServer.check_response(res)
+
+        return res
+
+    async def download_files(self, file_list: list, download) -> list[DataFile]:
+        """Awaits `download` on every file of the list, all at once if concurrent.
+        Results keep the order of the list.
+        """
+
+        download_slot = AsyncFileServer.get_download_slot(self.type)
+
+        async def bounded_download(file):
+            async with download_slot:
+                return await download(file)
+
+        if not self.concurrent:
+            return [await bounded_download(file) for file in file_list]
+
+        return list(await asyncio.gather(*map(bounded_download, file_list)))
+
+    def iterate_downloads(self, file_list: list, download):
+        raise TypeError(f"{type(self).__name__} is async, use download_files instead")
+
+    def connection_stats(self) -> dict:
+        raise TypeError(f"{type(self).__name__} does not track its connections")
+
+    async def get_data_file(
+        self, chain: CHAIN, category: FILE_CATEGORY, file: dict, fetch
+    ) -> DataFile:
+        """Downloads a listed file with `fetch` unless cached, and decompresses it.
+        Disk access and decompression run in a worker thread.
+        """
+        if self.cache is None:
+            content = await fetch()
+        else:
+            name, timestamp = self.get_file_identity(file)
+            key = (self.type.name, chain.name, category.name, name, timestamp)
+            content = await asyncio.to_thread(self.cache.get, key)
+            if content is None:
+                content = await asyncio.to_thread(self.cache.put, key, await fetch())
+
+        return DataFile(
+            content=await asyncio.to_thread(self.decompress, content, category),
+            chain=chain,
+            category=category,
+        )
+
+    async def get_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[DataFile]:
+        """Gets a certain amount of files of a specific type."""
+        self.verify_chain(chain)
+        file_list = await self.list_files(chain, category, amount, additional_data)
+
+        return await self.get_listed_files(chain, category, file_list)
+
+    async def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        """Downloads files picked from the server's listing (see `list_files`)."""
+        raise NotImplementedError()
+
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ):
+        raise TypeError(
+            f"{type(self).__name__} is async, await get_listed_files instead"
+        )
+
+    async def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        """Returns the server's listing of a certain amount of files of a type."""
+        raise NotImplementedError()
+
+    async def get_latest_time(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict] = None
+    ) -> datetime | None:
+        if file_list is None:
+            file_list = await self.list_files(chain, category, self.PROBE_AMOUNT)
+
+        return FileServer.get_latest_time(self, chain, category, file_list)
+
+    async def updated(self, chain: CHAIN, category: FILE_CATEGORY) -> bool:
+        self.verify_chain(chain)
+        latest = await self.get_latest_time(chain, category)
+        if latest is None:
+            return False
+
+        watermark = self.watermarks.get(self.watermark_key(chain, category))
+
+        return watermark is None or latest > watermark
+
+    async def mark_updated(
+        self, chain: CHAIN, category: FILE_CATEGORY, files: list[dict] | datetime
+    ):
+        if isinstance(files, datetime):
+            time = files
+        else:
+            time = await self.get_latest_time(chain, category, files)
+
+        if time is not None:
+            self.watermarks.set(self.watermark_key(chain, category), time)
+
+
+class AsyncFileServerCerberus(AsyncFileServer, FileServerCerberus):
+    def __init__(
+        self,
+        type: SERVER_TYPE,
+        concurrent: bool = True,
+        cache: FileCache = None,
+        watermarks: Watermarks = None,
+    ) -> None:
+        super().__init__(type, concurrent, cache, watermarks)
+        # the logins themselves are shared with FileServerCerberus
+        self.login_locks = {chain: asyncio.Lock() for chain in CHAIN}
+
+    async def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        async def download(file) -> DataFile:
+            return await self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(file["fname"], chain),
+            )
+
+        return await self.download_files(file_list, download)
+
+    async def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        return await self.get_file_list(chain, category, amount, date=None)
+
+    async def get_file_content(self, file_name: str, chain: CHAIN) -> IO[bytes]:
+        download_url = f"{self.base_url}{self.FILE_DOWNLOAD}/{file_name}"
+        content = spooled_file()
+        await self.send_logged_in(
+            chain,
+            lambda csrf, cftp: self.fetch(
+                "GET",
+                download_url,
+                check=False,
+                file=content,
+                cookies={"cftpSID": cftp},
+            ),
+        )
+
+        return content
+
+    async def login(self, chain: CHAIN):
+        login_url = self.base_url + self.LOGIN
+        user_url = self.base_url + self.LOGIN + self.USER
+
+        res = await self.fetch("GET", login_url)
+
+        csrf_token = self.extract_csrf(await res.read())
+        cftp_token = self.get_cookie(res, "cftpSID")
+
+        username = CHAINS_DATA[chain]["server"]["creds"]["username"]
+        password = CHAINS_DATA[chain]["server"]["creds"]["password"]
+        login_params = {
+            "r": "",
+            "username": username,
+            "password": password,
+            "Submit": self.SUBMIT,
+            "csrftoken": csrf_token,
+        }
+        headers = {"Cookie": f"cftpSID={cftp_token}"}
+
+        # /login/user redirects to /file
+        res = await self.fetch("POST", user_url, params=login_params, headers=headers)
+
+        return (self.extract_csrf(await res.read()), self.get_cookie(res, "cftpSID"))
+
+    async def get_login(
+        self, chain: CHAIN, expired: tuple = None
+    ) -> tuple[str, str, float]:
+        """Returns the chain's cached (csrf, cftp, login time), logging in if needed.
+        `expired` is a login the server rejected; it is replaced unless already done.
+        """
+        max_age = self.server_data["metadata"]["login_max_age"]
+        async with self.login_locks[chain]:
+            login = self.logins.get(chain)
+            if (
+                login is None
+                or login is expired
+                or time.monotonic() - login[2] > max_age
+            ):
+                login = (*await self.login(chain), time.monotonic())
+                self.logins[chain] = login
+
+        return login
+
+    def is_logged_out(self, res: aiohttp.ClientResponse) -> bool:
+        """Returns wether the request failed because the session is no longer valid."""
+        if res.status in (401, 403):
+            return True
+
+        # an expired session is redirected back to the login page
+        return res.url.path.startswith(self.LOGIN)
+
+    async def send_logged_in(self, chain: CHAIN, send) -> aiohttp.ClientResponse:
+        """Sends a request using the chain's cached (csrf, cftp) tokens.
+        Logs in again and retries once if the server rejected the cached session.
+        """
+        login = await self.get_login(chain)
+        res = await send(login[0], login[1])
+        if self.is_logged_out(res):
+            login = await self.get_login(chain, expired=login)
+            res = await send(login[0], login[1])
+
+        AsyncFileServer.check_response(res)
+
+        return res
+
+    async def get_file_list(
+        self,
+        chain: CHAIN,
+        category: FILE_CATEGORY,
+        amount: int,
+        date: datetime = None,
+        store_id: str = None,
+    ) -> list:
+        body_params = {
+            "iDisplayLength": amount,  # how many we want the server to return
+            "mDataProp_1": "typeLabel",
+            "sSearch_1": "file",  # we only want files
+            "sSearch": self.get_search_string(chain, category, store_id, date),
+        }
+
+        res = await self.send_logged_in(
+            chain,
+            lambda csrf, cftp: self.fetch(
+                "POST",
+                self.base_url + self.FILE_LIST,
+                check=False,
+                headers={"Cookie": f"cftpSID={cftp}"},
+                data={**body_params, "csrftoken": csrf},
+            ),
+        )
+
+        data = json.loads(await res.read())
+        file_list = list(data.get("aaData"))
+
+        return file_list
+
+
+class AsyncFileServerShufersal(AsyncFileServer, FileServerShufersal):
+    async def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        async def download(file) -> DataFile:
+            return await self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(file["download_link"]),
+            )
+
+        return await self.download_files(file_list, download)
+
+    async def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        await self.get_affinity_tokens()
+        file_list = []
+        page = 1
+        while len(file_list) < amount:
+            res = await self.update_categories(category=category, page=page)
+            if not self.add_page(file_list, self.get_file_list(await res.read())):
+                break
+
+            page += 1
+
+        return file_list[:amount]
+
+    async def get_affinity_tokens(self):
+        res = await self.fetch("GET", self.base_url)
+
+        ARRaffinity = self.get_cookie(res, "ARRAffinity")
+        ARRAffinitySameSite = self.get_cookie(res, "ARRAffinitySameSite")
+
+        return (ARRaffinity, ARRAffinitySameSite)
+
+    async def update_categories(
+        self,
+        category=FILE_CATEGORY,
+        store=0,  # All
+        page=1,
+    ):
+        params = {
+            "catID": self.get_category_parameter_name(category),
+            "storeId": store,
+            "page": page,
+        }
+
+        return await self.fetch(
+            "GET", self.base_url + self.SHUFERSAL_UPDATE_CATEGORY, data=params
+        )
+
+    async def get_file_content(self, url_download: str) -> IO[bytes]:
+        content = spooled_file()
+        await self.fetch("GET", url_download, file=content)
+
+        return content
+
+    async def get_prices(self, amount: int) -> list:
+        await self.get_affinity_tokens()
+        res = await self.update_categories()
+        file_list = self.get_file_list(await res.read())
+
+        async def download(file) -> IO[bytes]:
+            content = await self.get_file_content(file["download_link"])
+            return await asyncio.to_thread(
+                self.decompress, content, FILE_CATEGORY.Prices
+            )
+
+        return await self.download_files(file_list[:amount], download)
+
+
+class AsyncFileServerSuperPharm(AsyncFileServer, FileServerSuperPharm):
+    async def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        async def download(file) -> DataFile:
+            return await self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(
+                    file["download_link"], file["session_cookie"]
+                ),
+            )
+
+        return await self.download_files(file_list, download)
+
+    async def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        res, cookie = await self.update_categories(category=category)
+
+        # downloads are only allowed with the session the listing was made in
+        return [
+            {**file, "session_cookie": cookie}
+            for file in self.get_file_list(await res.read())[:amount]
+        ]
+
+    async def update_categories(
+        self,
+        category: FILE_CATEGORY,
+        date: str = None,
+        store="",
+    ):
+        params = {
+            "type": self.get_category_parameter_name(category),
+            "date": date or FileServerSuperPharm.time_to_date_string(),
+            "store": "",  # for the meantime, this is "All"
+        }
+        res = await self.fetch("GET", self.base_url, params=params)
+
+        return (res, self.get_cookie(res, self.SUPER_PHARM_SESSION_COOKIE))
+
+    async def get_file_content(self, download_url: str, cookie: str) -> IO[bytes]:
+        auth_cookie = {self.SUPER_PHARM_SESSION_COOKIE: cookie}
+        download_res = await self.fetch(
+            "GET", self.base_url + download_url, cookies=auth_cookie
+        )
+        download_descriptor = json.loads(await download_res.read())
+        content = spooled_file()
+        await self.fetch(
+            "GET",
+            self.base_url + download_descriptor["href"],
+            file=content,
+            cookies=auth_cookie,
+        )
+
+        return content
+
+
+class AsyncFileServerNibit(AsyncFileServer, FileServerNibit):
+    async def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        async def download(file) -> DataFile:
+            return await self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(file["download_link"]),
+            )
+
+        return await self.download_files(file_list, download)
+
+    async def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        content = await self.update_parameters(
+            chain,
+            category,
+            datetime.now(),
+            additional_data.get("subchain", "") if additional_data is not None else "",
+            additional_data.get("store_id", "") if additional_data is not None else "",
+        )
+
+        return self.get_file_list(content, amount)
+
+    async def get_file_content(self, download_url: str) -> IO[bytes]:
+        content = spooled_file()
+        await self.fetch("GET", self.base_url + download_url, file=content)
+
+        return content
+
+    async def update_parameters(
+        self,
+        chain: CHAIN,
+        category: FILE_CATEGORY,
+        date: datetime = None,
+        subchain: str = "",
+        store_id: str = "",
+    ) -> bytes:
+        params = {
+            "code": self.make_request_code(chain, subchain, store_id),
+            "date": "" if date is None else date.strftime("%d/%m/%Y"),
+            "fileType": self.get_category_parameter_name(category),
+        }
+        res = await self.fetch("GET", self.base_url, params=params)
+
+        return await res.read()
+
+
+class AsyncFileServerBinaProjects(AsyncFileServer, FileServerBinaProjects):
+    async def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        async def download(file) -> DataFile:
+            return await self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(chain, file["FileNm"]),
+            )
+
+        return await self.download_files(file_list, download)
+
+    async def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        file_list = await self.update_parameters(
+            chain=chain, category=category, date=datetime.today()
+        )
+
+        return file_list[:amount]
+
+    async def get_file_content(self, chain: CHAIN, filename: str) -> IO[bytes]:
+        params = {"FileNm": filename}
+        download_url = await self.fetch(
+            "GET", self.get_subdomain_by_chain(chain) + "/Download.aspx", params=params
+        )
+
+        content = spooled_file()
+        await self.fetch(
+            "GET", json.loads(await download_url.read())[0]["SPath"], file=content
+        )
+
+        return content
+
+    async def update_parameters(
+        self,
+        chain: CHAIN,
+        category: FILE_CATEGORY,
+        date: datetime = None,
+        store_id: str = "0",  # all
+    ) -> list:
+        params = {
+            "_": int(time.time()),
+            "WStore": store_id,
+            "WFileType": self.get_category_parameter_name(category),
+            "WDate": "" if date is None else date.strftime("%d/%m/%Y"),
+        }
+        res = await self.fetch(
+            "GET",
+            self.get_subdomain_by_chain(chain) + "/MainIO_Hok.aspx",
+            params=params,
+        )
+
+        return json.loads(await res.read())
+
+
+async def get_all_files(
+    category: FILE_CATEGORY,
+    amount: int,
+    chains: list[CHAIN] = None,
+    cache: FileCache = None,
+) -> dict[CHAIN, list[DataFile]]:
+    """Downloads files of every given chain (all chains by default) at the same time,
+    so the crawl takes as long as the slowest server rather than the sum of them.
+    """
+    chains = list(CHAIN) if chains is None else chains
+    server_types = {CHAINS_DATA[chain]["server"]["type"] for chain in chains}
+
+    async with AsyncExitStack() as stack:
+        servers = {
+            server_type: await stack.enter_async_context(
+                AsyncFileServer(server_type, cache=cache)
+            )
+            for server_type in server_types
+        }
+        file_lists = await asyncio.gather(
+            *(
+                servers[CHAINS_DATA[chain]["server"]["type"]].get_files(
+                    chain=chain, category=category, amount=amount
+                )
+                for chain in chains
+            )
+        )
+
+    return dict(zip(chains, file_lists))
@@ -0,0 +1,522 @@
+"""Rough benchmarks of the hot paths. Run with `python benchmark.py [name [args]]`."""
+
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from constants import *
+from analytics import overlap_histogram, price_statistics
+from database import Database
+from entity import EntityBatch, ParsedItem
+from file_cache import FileCache
+from file_server import FileServer
+from parser import Parser, ParserUtils
+from price_columns import CodeTable, PriceColumns
+from Levenshtein import jaro_winkler
+
+import process
+from process import derive_name, normalize_whitespace, tokenize_name
+
+
+def timed(function, *args) -> float:
+    """Returns how many seconds a call took."""
+    start = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start
+
+
+def fake_item_instances(amount: int) -> list[dict]:
+    return [
+        {
+            "code": str(7290000000000 + i),
+            "store_id": str(i % 300),
+            "chain_id": "7290000000001",
+            "subchain_id": "1",
+            "type": ITEM_TYPE.Normal,
+            "price": round(random.uniform(1, 100), 2),
+            "allow_discount": bool(i % 2),
+        }
+        for i in range(amount)
+    ]
+
+
+def benchmark_insert(amount: int = 200_000):
+    """Compares INSERT with executemany to COPY, on a local Postgres.
+    Rows go to a temporary copy of Item_Instance, so nothing is left behind.
+    """
+    amount = int(amount)
+    entities = fake_item_instances(amount)
+
+    with Database() as db:
+        db.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS Item_Instance
+            (LIKE public.Item_Instance INCLUDING ALL)
+            """
+        )
+
+        for bulk in (False, True):
+            db.execute("TRUNCATE Item_Instance")
+            seconds = timed(
+                lambda: db.insert_entities(TABLE.Item_Instance, entities, bulk=bulk)
+            )
+            print(
+                f"{'COPY' if bulk else 'INSERT'}: {amount} rows in {seconds:.2f}s "
+                f"({amount / seconds:,.0f} rows/s)"
+            )
+
+
+SYNTHETIC_WORDS = [
+    "חלב",
+    "תנובה",
+    "טרי",
+    "גבינה",
+    "לבנה",
+    "צהובה",
+    "עמק",
+    "שוקולד",
+    "מריר",
+    "פרה",
+    "במבה",
+    "אסם",
+    "ביסלי",
+    "גריל",
+    "יוגורט",
+    "דנונה",
+    "תות",
+    "וניל",
+    "קפה",
+    "נמס",
+    "עלית",
+    "שמן",
+    "זית",
+    "כתית",
+    "מעולה",
+    "אורז",
+    "פרסי",
+    "סוגת",
+    "פסטה",
+    "ספגטי",
+    "רוטב",
+    "עגבניות",
+    "קטשופ",
+    "חומוס",
+    "טחינה",
+    "גולמית",
+    "מלח",
+    "סוכר",
+    "לבן",
+    "קמח",
+]
+
+
+def synthetic_name_lists(codes: int = 1000, chains: int = 100) -> list[list[str]]:
+    """Names of the same items as different chains would write them: misspelled,
+    abbreviated, reordered and with units."""
+    random.seed(0)
+
+    def misspell(word: str) -> str:
+        if len(word) < 3 or random.random() < 0.7:
+            return word
+        i = random.randrange(len(word) - 1)
+        return random.choice(
+            [word[:i] + word[i + 1 :], word[:i] + word[i + 1] + word[i] + word[i + 2 :]]
+        )
+
+    name_lists = []
+    for _ in range(codes):
+        words = random.sample(SYNTHETIC_WORDS, random.randint(2, 5))
+        unit = random.choice(["", "1 ליטר", "500 גרם", "250 מל", 'ק"ג 1'])
+        names = []
+        for _ in range(random.randint(2, chains)):
+            name_words = [misspell(word) for word in words]
+            if random.random() < 0.2:
+                random.shuffle(name_words)
+            if random.random() < 0.3:
+                name_words.append(random.choice(SYNTHETIC_WORDS))
+            names.append(" ".join(name_words + ([unit] if unit else [])))
+        name_lists.append(names)
+
+    return name_lists
+
+
+reference_whitespace_pattern = re.compile(r"\s+|-")
+
+
+def reference_normalize_whitespace(text: str) -> str | None:
+    """normalize_whitespace as it was, before its single pass rewrite."""
+    if text:
+        return reference_whitespace_pattern.sub(
+            " ", text.replace("-", " ").replace("&", " אנד ").strip()
+        )
+    return None
+
+
+reference_units_pattern = re.compile(
+    rf"(\d+\.?\d*) ?({'|'.join(map(re.escape, UNIT_HEBREW))})\b(?!%)"
+    rf"|\b({'|'.join(map(re.escape, UNIT_HEBREW))}) ?(\d+\.?\d*)\b(?!%)"
+)
+
+
+def reference_derive_name(name_list: list[str]) -> str:
+    """derive_name as it was, before its token scoring was batched."""
+    name_count = len(name_list)
+    derived_tokens = defaultdict(float)
+    token_instances = defaultdict(list)
+    merged_tokens = set()
+    merging_tokens = set()
+
+    for name in name_list:
+        tokens = reference_normalize_whitespace(
+            reference_units_pattern.sub("", name)
+        ).split(" ")
+        for i in range(len(tokens)):
+            token_instances[tokens[i]].append(i)
+
+    token_list = list(token_instances.keys())
+    for token in token_list:
+        if token in merged_tokens:
+            continue
+
+        unmerged_tokens = [
+            j for j in token_list if not j in merged_tokens and j != token
+        ]
+
+        similar_tokens = [
+            other
+            for other in unmerged_tokens
+            if jaro_winkler(
+                token, other, score_cutoff=process.TOKEN_SIMILARITY_THRESHOLD
+            )
+        ]
+
+        if len(similar_tokens) != 0:
+            merging_token = token
+            longest_similar_token = max(similar_tokens, key=len)
+            if len(longest_similar_token) > len(token):
+                merging_token = longest_similar_token
+                similar_tokens.remove(merging_token)
+                similar_tokens.append(token)
+
+            merging_tokens.add(merging_token)
+            merged_tokens.add(merging_token)
+            for similar_token in similar_tokens:
+                merged_tokens.add(similar_token)
+                token_instances[merging_token].extend(token_instances[similar_token])
+
+    for token, indexes in token_instances.items():
+        if token in merged_tokens and not token in merging_tokens:
+            continue
+
+        number_of_occurrences = len(indexes)
+        if number_of_occurrences / name_count < process.TOKEN_RATIO_THRESHOLD:
+            continue
+
+        index_count = {i: indexes.count(i) for i in indexes}
+        index_weights = {i: index_count[i] / number_of_occurrences for i in index_count}
+        weighted_mean_sum = sum(
+            key * index_count[key] * index_weights[key] for key in index_count
+        )
+
+        derived_tokens[token] = weighted_mean_sum / number_of_occurrences
+
+    return " ".join(
+        sorted(derived_tokens.keys(), key=lambda token: derived_tokens[token])
+    )
+
+
+# real names of a sample of the codes sold by several chains, see make_names_fixture
+NAMES_FIXTURE = Path(__file__).parent / "fixtures" / "names.json"
+
+
+def make_names_fixture(path: str = NAMES_FIXTURE, amount: int = 300):
+    """Writes the names of `amount` random codes named by at least two chains, taken
+    from the parsed newest PricesFull file of every chain, as the JSON of code ->
+    items which `load_name_lists` reads.
+    """
+    amount = int(amount)
+    cache = FileCache()
+    servers = {
+        server_type: FileServer(server_type, cache=cache) for server_type in SERVER_TYPE
+    }
+    parser = Parser()
+
+    names = defaultdict(dict)  # code -> chain -> name
+    for chain in CHAIN:
+        server = servers[CHAINS_DATA[chain]["server"]["type"]]
+        try:
+            for file in server.get_files(chain, FILE_CATEGORY.PricesFull, 1):
+                for item in parser.parse(file):
+                    if item.name:
+                        names[item.code].setdefault(chain.name, item.name)
+        except Exception as e:
+            print(f"Skipping {chain.name}: {e}")
+
+    shared = sorted(code for code, chains in names.items() if len(chains) > 1)
+    if not shared:
+        print("No code is named by two chains, the fixture was not written")
+        return
+
+    sample = random.Random(0).sample(shared, min(amount, len(shared)))
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                code: [
+                    {"chain": chain, "name": name}
+                    for chain, name in sorted(names[code].items())
+                ]
+                for code in sorted(sample)
+            },
+            file,
+            ensure_ascii=False,
+            indent=1,
+        )
+
+    print(f"Wrote the names of {len(sample)} of {len(shared)} shared codes to {path}")
+
+
+def load_name_lists(path: str = None) -> list[list[str]]:
+    """The names per item code in `path` (the JSON of code -> parsed items which
+    parser.py and make_names_fixture write), by default the names fixture.
+    "synthetic" (or a missing fixture) gives synthetic names instead.
+    """
+    if path is None:
+        if NAMES_FIXTURE.exists():
+            path = NAMES_FIXTURE
+        else:
+            print(f"No {NAMES_FIXTURE}, run `python benchmark.py names_fixture`")
+            path = "synthetic"
+
+    if path == "synthetic":
+        print("Using synthetic names")
+        return synthetic_name_lists()
+
+    with open(path, "r", encoding="utf-8") as file:
+        items_dict = json.load(file)
+
+    return [
+        [item["name"] for item in items if item["name"]]
+        for items in items_dict.values()
+    ]
+
+
+def benchmark_derive_name(path: str = None):
+    """Compares derive_name, batched and pair by pair, to the original derive_name,
+    on the name lists of `load_name_lists`.
+    """
+    name_lists = load_name_lists(path)
+    print(f"{len(name_lists)} codes, {sum(map(len, name_lists))} names")
+    derive_name(name_lists[0])  # warm up the scoring libraries
+
+    implementations = {
+        "original": reference_derive_name,
+        "pair by pair": lambda names: derive_name(names, exhaustive=True),
+        "batched": derive_name,
+    }
+    results = {}
+    for name, implementation in implementations.items():
+        tokenize_name.cache_clear()
+        start = time.perf_counter()
+        results[name] = [implementation(names) for names in name_lists]
+        print(f"{name}: {time.perf_counter() - start:.2f}s")
+
+    assert (
+        results["original"] == results["pair by pair"] == results["batched"]
+    ), "derive_name changed derived names"
+
+
+def benchmark_scoring_crossover(path: str = None):
+    """Times derive_name with its tokens scored pair by pair and batched, by the
+    number of distinct tokens of the name lists, to find where batching pays off
+    (process.BATCHED_SCORING_MIN_TOKENS).
+    """
+    name_lists = load_name_lists(path)
+    derive_name(name_lists[0])  # warm up the scoring libraries
+
+    minimum_tokens = process.BATCHED_SCORING_MIN_TOKENS
+    process.BATCHED_SCORING_MIN_TOKENS = 0
+    # token count bucket -> [pair by pair seconds, batched seconds, name lists]
+    buckets = defaultdict(lambda: [0.0, 0.0, 0])
+    try:
+        for names in name_lists:
+            token_count = len(set().union(*map(tokenize_name, names)))
+            bucket = buckets[token_count // 4 * 4]
+            for i, exhaustive in enumerate((True, False)):
+                bucket[i] += timed(
+                    lambda: derive_name(names, exhaustive=exhaustive)
+                )
+            bucket[2] += 1
+    finally:
+        process.BATCHED_SCORING_MIN_TOKENS = minimum_tokens
+
+    for token_count, (exhaustive, batched, count) in sorted(buckets.items()):
+        print(
+            f"{token_count}-{token_count + 3} tokens ({count} codes): "
+            f"pair by pair {exhaustive / count * 1e6:.0f}us, "
+            f"batched {batched / count * 1e6:.0f}us"
+        )
+
+
+def benchmark_normalize(items: int = 1_000_000):
+    """Compares normalize_whitespace to the reference, on the whitespace normalised
+    fields of `items` synthetic items, which repeat like real ones do across stores.
+    """
+    items = int(items)
+    random.seed(0)
+    names = [names[0] for names in synthetic_name_lists(5000, 2)]
+    descriptions = [f"{name} & {random.choice(SYNTHETIC_WORDS)}" for name in names]
+    manufacturers = [
+        f"{random.choice(SYNTHETIC_WORDS)} - {random.choice(SYNTHETIC_WORDS)} בע\"מ"
+        for _ in range(500)
+    ]
+    countries = ["ישראל", "איטליה", "גרמניה", "  טורקיה ", "ארה\"ב", "לא ידוע"]
+    units = ["100 גרם", "ליטר", "יחידה", "100 מ\"ל", "ק\"ג"]
+    fields = [
+        (
+            str(7290000000000 + i % 50_000),
+            random.choice(names),
+            random.choice(manufacturers),
+            random.choice(countries),
+            random.choice(descriptions),
+            random.choice(units),
+        )
+        for i in range(items)
+    ]
+
+    normalize_whitespace.cache_clear()
+    results = {}
+    for normalize in (reference_normalize_whitespace, normalize_whitespace):
+        start = time.perf_counter()
+        results[normalize] = [
+            [normalize(field) for field in item_fields] for item_fields in fields
+        ]
+        seconds = time.perf_counter() - start
+        print(
+            f"{normalize.__name__}: {seconds:.2f}s "
+            f"({seconds / items * 1_000_000:.2f}s per million items)"
+        )
+
+    assert (
+        results[reference_normalize_whitespace] == results[normalize_whitespace]
+    ), "normalize_whitespace changed the normalised fields"
+
+
+def benchmark_memory(items: int = 100_000):
+    """Measures the memory taken by `items` parsed items of a store, as dicts (as
+    create_item used to return them), as records, and as a columnar batch.
+    """
+    items = int(items)
+    random.seed(0)
+    names = [names[0] for names in synthetic_name_lists(5000, 2)]
+    arguments = [
+        (
+            "7290027600007",
+            "001",
+            "042",
+            str(7290000000000 + i),
+            "1",
+            random.choice(names),
+            random.choice(SYNTHETIC_WORDS),
+            "ישראל",
+            random.choice(names),
+            "גרם",
+            f"{random.randint(1, 1000)}.00",
+            "0",
+            "100 גרם",
+            f"{random.uniform(1, 50):.2f}",
+            "1",
+            "1",
+            f"{random.uniform(1, 100):.2f}",
+            "1",
+        )
+        for i in range(items)
+    ]
+
+    representations = {
+        "dicts": lambda: [
+            ParserUtils.create_item(*item)._asdict() for item in arguments
+        ],
+        "records": lambda: [ParserUtils.create_item(*item) for item in arguments],
+        "batch": lambda: EntityBatch(
+            ParsedItem, (ParserUtils.create_item(*item) for item in arguments)
+        ),
+    }
+    for name, build in representations.items():
+        normalize_whitespace.cache_clear()
+        tracemalloc.start()
+        built = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del built
+        print(f"{name}: {size / 2**20:.1f} MiB ({size / items:.0f} bytes per item)")
+
+
+def benchmark_analytics(rows: int = 5_000_000):
+    """Times the overlap histogram and the price statistics of `rows` synthetic item
+    instances of 40k codes in 3000 stores of 30 chains, and compares the histogram
+    to counting the chains per code in Python.
+    """
+    rows = int(rows)
+    generator = np.random.default_rng(0)
+    codes = CodeTable()
+    codes.encode([str(7290000000000 + i) for i in range(40_000)])
+    price = generator.uniform(1, 100, rows).round(2)
+    columns = PriceColumns(
+        codes,
+        generator.integers(0, len(codes), rows, dtype=np.int32),
+        [(str(i % 30), "1", str(i)) for i in range(3000)],
+        generator.integers(0, 3000, rows, dtype=np.int32),
+        price,
+        np.ones(rows),
+        price,
+    )
+
+    start = time.perf_counter()
+    chains = defaultdict(set)
+    for code, store in zip(columns.code.tolist(), columns.store.tolist()):
+        chains[code].add(columns.stores[store][0])
+    counts = np.bincount([len(chains[code]) for code in range(len(codes))])
+    expected = np.cumsum(counts[::-1])[::-1]
+    print(f"overlap in Python: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    histogram = overlap_histogram(columns)
+    print(f"overlap_histogram: {time.perf_counter() - start:.2f}s")
+    assert (histogram == expected).all(), "overlap_histogram counted wrong"
+
+    start = time.perf_counter()
+    price_statistics(columns)
+    print(f"price_statistics: {time.perf_counter() - start:.2f}s")
+
+
+BENCHMARKS = {
+    "insert": benchmark_insert,
+    "derive_name": benchmark_derive_name,
+    "scoring_crossover": benchmark_scoring_crossover,
+    "normalize": benchmark_normalize,
+    "memory": benchmark_memory,
+    "analytics": benchmark_analytics,
+}
+
+# commands which are not benchmarks, only run by name
+TOOLS = {"names_fixture": make_names_fixture}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(f"--- {sys.argv[1]}")
+        {**BENCHMARKS, **TOOLS}[sys.argv[1]](*sys.argv[2:])
+    else:
+        for name in BENCHMARKS:
+            print(f"--- {name}")
+            BENCHMARKS[name]()
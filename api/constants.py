@@ -55,14 +55,18 @@ ENTITY_TYPE_TO_FILE_CATEGORY = {
     ENTITY_TYPE.Store: FILE_CATEGORY.Stores,
 }
 
+# "entity_list" ends with the tag of the entities, and "header" maps file level fields
+# (which are read before the entities) to their tags.
 FILE_FORMAT_SUPER_PHARM = {
     "root": "OrderXml Envelope",
-    "entity_list": "Header Details",
+    "entity_list": "Header Details Line",
+    "header": {"subchain_id": "SubChainId", "store_id": "StoreId"},
 }
 
 FILE_FORMAT_PRICES_CERBERUS = {
     "root": "root",
     "entity_list": "Items Item",
+    "header": {"subchain_id": "SubChainId", "store_id": "StoreId"},
 }
 
 FILE_FORMAT_PROMOS_CERBERUS = {
@@ -70,16 +74,22 @@ FILE_FORMAT_PROMOS_CERBERUS = {
     "entity_list": "Promotions Promotion",
 }
 
-FILE_FORMAT_PRICES_SHUFERSAL = {"root": "root", "entity_list": "Items Item"}
+FILE_FORMAT_PRICES_SHUFERSAL = {
+    "root": "root",
+    "entity_list": "Items Item",
+    "header": {"subchain_id": "SubChainId", "store_id": "StoreId"},
+}
 
 FILE_FORMAT_PRICES_NIBIT = {
     "root": "Prices",
     "entity_list": "Products Product",
+    "header": {"subchain_id": "SubChainID", "store_id": "StoreID"},
 }
 
 FILE_FORMAT_PRICES_BINA_PROJECTS = {
     "root": "Root",
     "entity_list": "Items Item",
+    "header": {"subchain_id": "SubChainId", "store_id": "StoreId"},
 }
 
 ENTITY_FORMAT_ITEM_CERBERUS = {
@@ -182,6 +192,10 @@ SERVER_TYPE_DATA = {
         "metadata": {
             "domain": "https://url.publishedprices.co.il",
             "chain_by_subdomain": False,
+            "connection_pool": {"hosts": 2, "connections_per_host": 10},
+            "max_concurrent_downloads": 4,
+            "datetime_format": "%Y-%m-%dT%H:%M:%SZ",
+            "login_max_age": 20 * 60,  # seconds
         },
         "categories": {
             FILE_CATEGORY.All: {"parameter_name": "", "format": None},
@@ -241,6 +255,9 @@ SERVER_TYPE_DATA = {
         "metadata": {
             "domain": "https://prices.shufersal.co.il",
             "chain_by_subdomain": False,
+            "connection_pool": {"hosts": 4, "connections_per_host": 10},
+            "max_concurrent_downloads": 4,
+            "datetime_format": "%m/%d/%Y %I:%M:%S %p",
         },
         "categories": {
             FILE_CATEGORY.All: {"parameter_name": "0", "format": None},
@@ -338,6 +355,9 @@ SERVER_TYPE_DATA = {
         "metadata": {
             "domain": "https://prices.super-pharm.co.il",
             "chain_by_subdomain": False,
+            "connection_pool": {"hosts": 2, "connections_per_host": 10},
+            "max_concurrent_downloads": 2,
+            "datetime_format": "%Y-%m-%d %H:%M:%S",
         },
         "categories": {
             FILE_CATEGORY.All: {"parameter_name": "", "format": None},
@@ -407,6 +427,9 @@ SERVER_TYPE_DATA = {
         "metadata": {
             "domain": "https://laibcatalog.co.il/",
             "chain_by_subdomain": False,
+            "connection_pool": {"hosts": 2, "connections_per_host": 10},
+            "max_concurrent_downloads": 2,
+            "datetime_format": "%H:%M %d/%m/%Y",
         },
         "categories": {
             FILE_CATEGORY.All: {"parameter_name": "all", "format": None},
@@ -486,6 +509,9 @@ SERVER_TYPE_DATA = {
         "metadata": {
             "domain": "https://{}.binaprojects.com",
             "chain_by_subdomain": True,
+            "connection_pool": {"hosts": 12, "connections_per_host": 4},
+            "max_concurrent_downloads": 4,
+            "datetime_format": "%H:%M %d/%m/%Y",
         },
         "categories": {
             FILE_CATEGORY.All: {"parameter_name": "0", "format": None},
@@ -808,8 +834,73 @@ CHAINS_DATA = {
 }
 
 # DB
+DATABASE_POOL = {
+    "min_size": 1,
+    "max_size": 10,
+    "max_idle": 5 * 60,  # seconds before an unused connection above min is closed
+    "max_lifetime": 60 * 60,  # seconds before a connection is replaced
+    "timeout": 30,  # seconds to wait for a free connection
+}
+
 TABLE = Enum("TABLE", ["Chain", "Subchain", "Store", "Item", "Item_Instance"])
 
+# notified whenever an ingest committed new prices
+PRICES_UPDATED_CHANNEL = "prices_updated"
+
+# refreshed after every ingest, see db/schema.sql
+MATERIALIZED_VIEW = Enum(
+    "MATERIALIZED_VIEW", ["Cheapest_Item_Store", "Chain_Item_Price"]
+)
+
+PRICE_HISTORY = {
+    "retention_months": 24,  # older monthly partitions are dropped
+    "months_ahead": 1,  # partitions created in advance, past the current month
+}
+
+TABLE_COLUMNS = {
+    TABLE.Chain: ("id", "name"),
+    TABLE.Subchain: ("id", "chain_id", "name"),
+    TABLE.Store: (
+        "id",
+        "chain_id",
+        "subchain_id",
+        "bikoret_number",
+        "type",
+        "name",
+        "address",
+        "city",
+        "zip_code",
+    ),
+    TABLE.Item: (
+        "code",
+        "name",
+        "manufacturer_name",
+        "manufacture_country",
+        "manufacturer_item_description",
+        "unit_quantity",
+        "quantity",
+        "is_weighted",
+        "quantity_in_package",
+    ),
+    TABLE.Item_Instance: (
+        "code",
+        "store_id",
+        "chain_id",
+        "subchain_id",
+        "type",
+        "price",
+        "allow_discount",
+    ),
+}
+
+TABLE_PRIMARY_KEY = {
+    TABLE.Chain: ("id",),
+    TABLE.Subchain: ("id", "chain_id"),
+    TABLE.Store: ("id", "chain_id", "subchain_id"),
+    TABLE.Item: ("code",),
+    TABLE.Item_Instance: ("code", "store_id", "chain_id", "subchain_id"),
+}
+
 UNIT = Enum(
     "UNIT",
     {
@@ -0,0 +1,253 @@
+from collections import defaultdict
+from datetime import datetime
+import logging
+
+from constants import *
+from data_file import DataFile
+from database import Database
+from entity import EntityBatch, ParsedItem
+from file_cache import FileCache
+from file_server import FileServer
+from parser import Parser
+from utils import batched
+from watermarks import Watermarks
+
+logger = logging.getLogger(__name__)
+
+
+class Crawler:
+    """Keeps the database up to date with the chains' files, incrementally.
+    Every store is bootstrapped once from its newest PricesFull file; from then on
+    only the (much smaller) Prices files published since are downloaded, and applied
+    on top of the stored state according to each item's ITEM_STATUS.
+    Progress is kept per store in the servers' watermarks.
+    Files are downloaded, parsed and written lazily, a batch of items at a time.
+    """
+
+    LISTING_AMOUNT = 1000
+
+    def __init__(
+        self,
+        db: Database,
+        cache: FileCache = None,
+        watermarks: Watermarks = None,
+    ) -> None:
+        self.db = db
+        self.parser = Parser()
+        self.servers = {
+            server_type: FileServer(server_type, cache=cache, watermarks=watermarks)
+            for server_type in SERVER_TYPE
+        }
+
+    def crawl(self, chains: list[CHAIN] = None):
+        self.db.manage_history_partitions()
+        for chain in chains or CHAIN:
+            self.crawl_stores(chain)
+            self.crawl_prices(chain)
+
+        self.db.refresh_views()
+        self.db.notify(PRICES_UPDATED_CHANNEL)
+
+    def get_server(self, chain: CHAIN) -> FileServer:
+        return self.servers[CHAINS_DATA[chain]["server"]["type"]]
+
+    def crawl_stores(self, chain: CHAIN):
+        """Updates the chain's subchains and stores, if a new stores file is out."""
+        server = self.get_server(chain)
+        file_list = server.list_files(chain, FILE_CATEGORY.Stores, 1)
+        latest = server.get_latest_time(chain, FILE_CATEGORY.Stores, file_list)
+        watermark = server.watermarks.get(
+            server.watermark_key(chain, FILE_CATEGORY.Stores)
+        )
+        if not file_list:
+            return
+
+        # a listing without times can't be told apart from the loaded one, and
+        # loading it again is harmless
+        if latest is not None and watermark is not None and latest <= watermark:
+            return
+
+        [file] = server.get_listed_files(chain, FILE_CATEGORY.Stores, file_list)
+        subchains, stores = self.parser.parse(file)
+        self.db.upsert_entities(TABLE.Subchain, subchains, commit=False)
+        self.db.upsert_entities(TABLE.Store, stores, commit=False)
+        self.db.commit()
+
+        server.mark_updated(chain, FILE_CATEGORY.Stores, file_list)
+
+    def crawl_prices(self, chain: CHAIN):
+        """Applies every Prices file newer than its store's watermark, bootstrapping
+        stores without one from their newest PricesFull file first.
+        A store whose listed Prices files are all newer than its watermark, in a
+        listing cut short by LISTING_AMOUNT, may have missed some; it is bootstrapped
+        again instead, from a PricesFull file newer than its watermark.
+        """
+        server = self.get_server(chain)
+        full_files = self.get_files_by_store(
+            server, chain, FILE_CATEGORY.PricesFull, latest_only=True
+        )
+        delta_listing = server.list_files(
+            chain, FILE_CATEGORY.Prices, self.LISTING_AMOUNT
+        )
+        delta_files = self.group_files_by_store(
+            server, chain, delta_listing, latest_only=False
+        )
+        truncated = len(delta_listing) >= self.LISTING_AMOUNT
+
+        snapshots = {}  # store -> its newest (time, PricesFull file) to load
+        for store, [(time, file)] in full_files.items():
+            watermark = self.get_store_watermark(server, chain, store)
+            if watermark is None:
+                snapshots[store] = (time, file)
+
+        skipped = set()
+        for store, files in delta_files.items():
+            watermark = self.get_store_watermark(server, chain, store)
+            # files are newest first, so the last is the oldest listed
+            if watermark is None or not truncated or files[-1][0] <= watermark:
+                continue
+
+            full = full_files.get(store)
+            if full is not None and full[0][0] > watermark:
+                snapshots[store] = full[0]
+            else:
+                logger.warning(
+                    f"Skipping the Prices files of {chain.name} store {store}, some "
+                    "may be missing and there is no newer PricesFull file to reload"
+                )
+                skipped.add(store)
+
+        if snapshots:
+            self.bootstrap_prices(server, chain, list(snapshots.values()))
+
+        pending = []
+        for store, files in delta_files.items():
+            watermark = self.get_store_watermark(server, chain, store)
+            # stores without a PricesFull to build on yet, or without all their files
+            if watermark is None or store in skipped:
+                continue
+
+            pending.extend((time, file) for time, file in files if time > watermark)
+
+        pending.sort(key=lambda pending_file: pending_file[0])
+        # files are applied oldest first, as every delta depends on the previous one
+        data_files = server.iterate_listed_files(
+            chain, FILE_CATEGORY.Prices, [file for _, file in pending]
+        )
+        for (time, file), data_file in zip(pending, data_files):
+            self.apply_prices_delta(data_file)
+            self.set_store_watermark(server, chain, server.get_file_store(file), time)
+
+        server.mark_updated(chain, FILE_CATEGORY.Prices, [file for _, file in pending])
+
+    def bootstrap_prices(
+        self, server: FileServer, chain: CHAIN, full_files: list[tuple[datetime, dict]]
+    ):
+        """Loads the given (time, PricesFull file) snapshots of stores."""
+        data_files = server.iterate_listed_files(
+            chain, FILE_CATEGORY.PricesFull, [file for _, file in full_files]
+        )
+        for (time, file), data_file in zip(full_files, data_files):
+            self.apply_prices_snapshot(data_file)
+            self.set_store_watermark(server, chain, server.get_file_store(file), time)
+
+        server.mark_updated(
+            chain, FILE_CATEGORY.PricesFull, [file for _, file in full_files]
+        )
+
+    def get_files_by_store(
+        self,
+        server: FileServer,
+        chain: CHAIN,
+        category: FILE_CATEGORY,
+        latest_only: bool,
+    ) -> dict[str, list[tuple[datetime, dict]]]:
+        """Returns the (time, file) listing of a category by store, newest first."""
+        file_list = server.list_files(chain, category, self.LISTING_AMOUNT)
+
+        return self.group_files_by_store(server, chain, file_list, latest_only)
+
+    def group_files_by_store(
+        self,
+        server: FileServer,
+        chain: CHAIN,
+        file_list: list[dict],
+        latest_only: bool,
+    ) -> dict[str, list[tuple[datetime, dict]]]:
+        """Returns the (time, file) of listed files by store, newest first."""
+        files = defaultdict(list)
+        for file in file_list:
+            time = server.get_file_time(file)
+            store = server.get_file_store(file)
+            if time is None or store is None:
+                logger.warning(
+                    f"Skipping {chain.name} file {server.get_file_identity(file)[0]}, "
+                    "its store or time can't be read from its name"
+                )
+                continue
+
+            files[store].append((time, file))
+
+        for store in files:
+            files[store].sort(key=lambda listed: listed[0], reverse=True)
+            if latest_only:
+                del files[store][1:]
+
+        return files
+
+    def get_store_watermark(
+        self, server: FileServer, chain: CHAIN, store: str
+    ) -> datetime | None:
+        return server.watermarks.get(
+            server.watermark_key(chain, FILE_CATEGORY.Prices) + (store,)
+        )
+
+    def set_store_watermark(
+        self, server: FileServer, chain: CHAIN, store: str, time: datetime
+    ):
+        server.watermarks.set(
+            server.watermark_key(chain, FILE_CATEGORY.Prices) + (store,), time
+        )
+
+    def apply_prices_snapshot(self, file: DataFile):
+        """Replaces the stored items of the file's store with the file's items."""
+        codes = defaultdict(list)  # only the codes are kept, to delete the rest
+        for items in batched(self.parser.parse(file)):
+            batch = EntityBatch(ParsedItem, items)
+            self.db.upsert_entities(TABLE.Item, batch, update=False, commit=False)
+            self.db.upsert_entities(TABLE.Item_Instance, batch, commit=False)
+            store_codes = batch.rows(("chain_id", "subchain_id", "store_id", "code"))
+            for *store, code in store_codes:
+                codes[tuple(store)].append(code)
+
+        for (chain_id, subchain_id, store_id), store_codes in codes.items():
+            self.db.delete_store_items_except(
+                chain_id, subchain_id, store_id, store_codes, commit=False
+            )
+
+        self.db.commit()
+
+    def apply_prices_delta(self, file: DataFile):
+        """Applies the added, updated and removed items of a Prices file."""
+        for items in batched(self.parser.parse(file)):
+            batch = EntityBatch(ParsedItem, items)
+            removed = batch.where(
+                "status", lambda status: status == ITEM_STATUS.Removed
+            )
+            changed = batch.where(
+                "status", lambda status: status != ITEM_STATUS.Removed
+            )
+
+            if changed:
+                self.db.upsert_entities(TABLE.Item, changed, update=False, commit=False)
+                self.db.upsert_entities(TABLE.Item_Instance, changed, commit=False)
+
+            if removed:
+                self.db.delete_entities(TABLE.Item_Instance, removed, commit=False)
+
+        self.db.commit()
+
+
+if __name__ == "__main__":
+    with Database() as db:
+        Crawler(db, cache=FileCache()).crawl()
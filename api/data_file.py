@@ -1,13 +1,28 @@
+import io
+from typing import IO
+
 from constants import FILE_CATEGORY, SERVER_TYPE, CHAIN
 
 
 class DataFile:
     def __init__(
         self,
-        content: bytes,
+        content: bytes | IO[bytes],
         chain: CHAIN,
         category: FILE_CATEGORY,
     ) -> None:
-        self.content = content
+        # big files are kept as (spooled) file objects rather than bytes
+        self.stream = io.BytesIO(content) if isinstance(content, bytes) else content
         self.chain = chain
         self.category = category
+
+    @property
+    def content(self) -> bytes:
+        """The whole decompressed file. Prefer `open()` for big files."""
+        return self.open().read()
+
+    def open(self) -> IO[bytes]:
+        """Returns the file's content as a binary file object, rewound."""
+        self.stream.seek(0)
+
+        return self.stream
@@ -1,24 +1,86 @@
 # i love my dad
+import asyncio
+import atexit
 import psycopg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from datetime import date, datetime
+from enum import Enum
 from os import environ
+from threading import Lock
+from typing import AsyncIterator, Iterable, Iterator
 
-from entity import Entity
-from constants import TABLE
+from entity import Entity, EntityBatch
+from constants import (
+    DATABASE_POOL,
+    MATERIALIZED_VIEW,
+    PRICE_HISTORY,
+    TABLE,
+    TABLE_COLUMNS,
+    TABLE_PRIMARY_KEY,
+)
+from utils import BATCH_SIZE, batched
 
 
 class Database:
+    # one connection pool per process, which every instance borrows from
+    pool: ConnectionPool = None
+    pool_lock = Lock()
+    # the month of the newest price history partition this process created
+    history_month: date = None
+
     def __init__(self) -> None:
         self.connection = None
         self.cursor = None
 
-    def __enter__(self):
-        self.connection = psycopg.connect(
-            dbname="zilazol",
-            user="postgres",
-            password=environ.get("POSTGRES_PASSWORD"),
-            host="localhost",
-            port="5432",
+    @classmethod
+    def get_pool(cls) -> ConnectionPool:
+        with cls.pool_lock:
+            if cls.pool is None:
+                cls.pool = cls.create_pool()
+
+        return cls.pool
+
+    @staticmethod
+    def connection_parameters() -> dict:
+        return {
+            "dbname": "zilazol",
+            "user": "postgres",
+            "password": environ.get("POSTGRES_PASSWORD"),
+            "host": "localhost",
+            "port": "5432",
+        }
+
+    @staticmethod
+    def pool_parameters() -> dict:
+        return {
+            "kwargs": Database.connection_parameters(),
+            "min_size": int(
+                environ.get("ZILAZOL_DB_POOL_MIN_SIZE", DATABASE_POOL["min_size"])
+            ),
+            "max_size": int(
+                environ.get("ZILAZOL_DB_POOL_MAX_SIZE", DATABASE_POOL["max_size"])
+            ),
+            "max_idle": DATABASE_POOL["max_idle"],
+            "max_lifetime": DATABASE_POOL["max_lifetime"],
+            "timeout": DATABASE_POOL["timeout"],
+        }
+
+    @staticmethod
+    def create_pool() -> ConnectionPool:
+        pool = ConnectionPool(
+            **Database.pool_parameters(),
+            # connections are checked before being lent, broken ones are replaced
+            check=ConnectionPool.check_connection,
+            name="zilazol",
+            open=False,
         )
+        pool.open()
+        atexit.register(pool.close)
+
+        return pool
+
+    def __enter__(self):
+        self.connection = Database.get_pool().getconn()
         self.cursor = self.connection.cursor()
 
         return self
@@ -27,21 +89,44 @@ class Database:
         if not self.cursor.closed:
             self.cursor.close()
 
-        if not self.connection.closed:
-            self.connection.close()
+        # the pool rolls back whatever was not committed and drops broken connections
+        Database.get_pool().putconn(self.connection)
+        self.connection = None
 
         return False  # dont suppress exceptions
 
     def commit(self):
         self.connection.commit()
 
+    def notify(self, channel: str, *, commit: bool = True):
+        """Notifies the listeners of a channel, once the transaction is committed."""
+        self.cursor.execute(f"NOTIFY {channel}")
+        if commit:
+            self.commit()
+
+    @staticmethod
+    def listen(channel: str) -> Iterator[str]:
+        """Blocks and yields the payload of every notification sent to the channel.
+        Uses a connection of its own, as it is held for as long as it listens.
+        """
+        with psycopg.connect(
+            **Database.connection_parameters(), autocommit=True
+        ) as connection:
+            connection.execute(f"LISTEN {channel}")
+            for notification in connection.notifies():
+                yield notification.payload
+
     def execute(self, query: str, *, commit: bool = True):
         self.cursor.execute(query=query)
         if commit:
             self.commit()
 
-    def execute_many(self, query: str, iterable, *, commit: bool = True):
-        self.cursor.executemany(query=query, params_seq=iterable)
+    def execute_many(self, query: str, iterable: Iterable, *, commit: bool = True):
+        """Executes the query for every parameters tuple of the (possibly lazy)
+        iterable, in batches, so it is never materialized whole.
+        """
+        for batch in batched(iterable):
+            self.cursor.executemany(query=query, params_seq=batch)
         if commit:
             self.commit()
 
@@ -54,9 +139,432 @@ class Database:
 
         return self.cursor.fetchmany(amount)
 
-    def insert_entities(self, table: TABLE, entities: list[Entity]):
-        value_format = ", ".join(["%s" for _ in range(len(entities[0]))])
+    def insert_entities(
+        self,
+        table: TABLE,
+        entities: Iterable[Entity | dict | tuple] | EntityBatch,
+        *,
+        bulk: bool = False,
+        commit: bool = True,
+    ):
+        """Inserts the entities. With `bulk` they are streamed with COPY, which is
+        much faster for big loads but fails whole on a single conflicting row.
+        """
+        if bulk:
+            self.copy_entities(table.name, TABLE_COLUMNS[table], entities)
+            if commit:
+                self.commit()
+            return
+
+        columns = TABLE_COLUMNS[table]
+        value_format = ", ".join(["%s" for _ in columns])
+        self.execute_many(
+            f"""
+            INSERT INTO {table.name} ({", ".join(columns)}) VALUES ({value_format})
+            """,
+            Database.to_rows(entities, columns),
+            commit=commit,
+        )
+
+    def copy_entities(
+        self,
+        table_name: str,
+        columns: tuple[str],
+        entities: Iterable[Entity | dict | tuple] | EntityBatch,
+    ):
+        """Streams the entities into a table with COPY, without committing."""
+        with self.cursor.copy(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN"
+        ) as copy:
+            for row in Database.to_rows(entities, columns):
+                copy.write_row(row)
+
+    @staticmethod
+    def to_row(entity: Entity | dict | tuple, columns: tuple[str]) -> tuple:
+        """Returns the values of the given columns of an entity (a dict or a record),
+        enums as values.
+        """
+        data = entity.data if isinstance(entity, Entity) else entity
+        if isinstance(data, tuple):
+            values = (getattr(data, column) for column in columns)
+        else:
+            values = (data[column] for column in columns)
+
+        return tuple(
+            value.value if isinstance(value, Enum) else value for value in values
+        )
+
+    @staticmethod
+    def to_rows(
+        entities: Iterable[Entity | dict | tuple] | EntityBatch, columns: tuple[str]
+    ) -> Iterable[tuple]:
+        if isinstance(entities, EntityBatch):
+            return entities.rows(columns)
+
+        return (Database.to_row(entity, columns) for entity in entities)
+
+    def upsert_entities(
+        self,
+        table: TABLE,
+        entities: Iterable[Entity | dict | tuple] | EntityBatch,
+        *,
+        update: bool = True,
+        commit: bool = True,
+    ) -> int:
+        """Merges the entities into the table: they are copied into a temporary
+        staging table, then inserted in one statement which updates the existing
+        rows whose values changed (or leaves them as they are if `update` is false).
+        Reloading the same data is harmless and writes nothing.
+        Returns the amount of rows written.
+        """
+        columns = TABLE_COLUMNS[table]
+        primary_key = TABLE_PRIMARY_KEY[table]
+        updated_columns = [column for column in columns if column not in primary_key]
+        staging_table = f"Staging_{table.name}"
+
+        # rows are numbered in the order they are copied, for the last one to win
+        self.cursor.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging_table}
+            (LIKE {table.name}, ordinal BIGINT GENERATED ALWAYS AS IDENTITY)
+            ON COMMIT DELETE ROWS
+            """
+        )
+        self.cursor.execute(f"TRUNCATE {staging_table}")
+        self.copy_entities(staging_table, columns, entities)
+
+        if table == TABLE.Item_Instance:
+            self.record_price_changes(staging_table)
+
+        if update and updated_columns:
+            assignments = ", ".join(
+                f"{column} = EXCLUDED.{column}" for column in updated_columns
+            )
+            current = ", ".join(f"{table.name}.{column}" for column in updated_columns)
+            new = ", ".join(f"EXCLUDED.{column}" for column in updated_columns)
+            conflict_action = f"""
+            DO UPDATE SET {assignments}
+            WHERE ({current}) IS DISTINCT FROM ({new})
+            """
+        else:
+            conflict_action = "DO NOTHING"
+
+        # a key may appear twice in a load, but a row can only be updated once, so
+        # the last of them in the load is taken
+        self.cursor.execute(
+            f"""
+            INSERT INTO {table.name} ({", ".join(columns)})
+            SELECT DISTINCT ON ({", ".join(primary_key)}) {", ".join(columns)}
+            FROM {staging_table}
+            ORDER BY {", ".join(primary_key)}, ordinal DESC
+            ON CONFLICT ({", ".join(primary_key)}) {conflict_action}
+            """
+        )
+        written = self.cursor.rowcount
+
+        if commit:
+            self.commit()
+
+        return written
+
+    def delete_entities(
+        self,
+        table: TABLE,
+        entities: Iterable[Entity | dict | tuple] | EntityBatch,
+        *,
+        commit: bool = True,
+    ):
+        """Deletes the rows with the primary keys of the given entities."""
+        primary_key = TABLE_PRIMARY_KEY[table]
         self.execute_many(
-            f"""INSERT INTO {table.name} VALUES ({value_format})""",
-            [entity.to_value_tuple() for entity in entities],
+            f"""
+            DELETE FROM {table.name}
+            WHERE {" AND ".join(f"{column} = %s" for column in primary_key)}
+            """,
+            Database.to_rows(entities, primary_key),
+            commit=commit,
+        )
+
+    def delete_store_items_except(
+        self,
+        chain_id: str,
+        subchain_id: str,
+        store_id: str,
+        codes: list[str],
+        *,
+        commit: bool = True,
+    ):
+        """Deletes the item instances of a store whose codes are not in `codes`."""
+        self.cursor.execute(
+            """
+            DELETE FROM Item_Instance
+            WHERE chain_id = %s AND subchain_id = %s AND store_id = %s
+            AND code <> ALL(%s)
+            """,
+            (chain_id, subchain_id, store_id, codes),
+        )
+        if commit:
+            self.commit()
+
+    def record_price_changes(self, staging_table: str):
+        """Adds the staged item instances whose price differs from the stored one
+        (or which are new) to the price history. Must run before they are merged.
+        """
+        recorded_at = datetime.now()
+        # in case the crawler did not manage the partitions yet this month. the DDL
+        # locks the parent table, so it is only sent once a month
+        month = recorded_at.date().replace(day=1)
+        if Database.history_month is None or Database.history_month < month:
+            self.create_history_partition(month)
+
+        self.cursor.execute(
+            f"""
+            INSERT INTO Price_History
+            (recorded_at, price, code, store_id, chain_id, subchain_id)
+            SELECT %s, staged.price, staged.code, staged.store_id,
+                staged.chain_id, staged.subchain_id
+            FROM (
+                SELECT DISTINCT ON (code, store_id, chain_id, subchain_id) *
+                FROM {staging_table}
+                ORDER BY code, store_id, chain_id, subchain_id, ordinal DESC
+            ) AS staged
+            LEFT JOIN Item_Instance AS current
+            ON current.code = staged.code
+                AND current.store_id = staged.store_id
+                AND current.chain_id = staged.chain_id
+                AND current.subchain_id = staged.subchain_id
+            WHERE current.price IS DISTINCT FROM staged.price
+            """,
+            (recorded_at,),
+        )
+
+    @staticmethod
+    def add_months(month: date, months: int) -> date:
+        """Returns the first day of the month `months` after the month of `month`."""
+        index = month.year * 12 + month.month - 1 + months
+
+        return date(index // 12, index % 12 + 1, 1)
+
+    def create_history_partition(self, month: date):
+        """Creates the price history partition of the month starting at `month`."""
+        end = Database.add_months(month, 1)
+        self.cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS Price_History_{month:%Y_%m}
+            PARTITION OF Price_History
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')
+            """
+        )
+        with Database.pool_lock:
+            if Database.history_month is None or Database.history_month < month:
+                Database.history_month = month
+
+    def manage_history_partitions(self, today: date = None, *, commit: bool = True):
+        """Creates the monthly price history partitions of this month and the next
+        ones, and drops those older than the retention period.
+        """
+        this_month = (today or date.today()).replace(day=1)
+
+        for months in range(PRICE_HISTORY["months_ahead"] + 1):
+            self.create_history_partition(Database.add_months(this_month, months))
+
+        # partitions are named after their month, which sorts them chronologically
+        oldest = Database.add_months(this_month, -PRICE_HISTORY["retention_months"])
+        self.cursor.execute(
+            """
+            SELECT partition.relname
+            FROM pg_inherits
+            JOIN pg_class AS partition ON partition.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'price_history'::regclass
+            AND partition.relname ~ '^price_history_[0-9]{4}_[0-9]{2}$'
+            AND partition.relname < %s
+            """,
+            (f"price_history_{oldest:%Y_%m}",),
+        )
+        for (partition,) in self.get_rows():
+            self.cursor.execute(f"DROP TABLE {partition}")
+
+        if commit:
+            self.commit()
+
+    def refresh_views(self, *, commit: bool = True):
+        """Refreshes the materialized views, without blocking their readers."""
+        for view in MATERIALIZED_VIEW:
+            self.cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view.name}")
+
+        if commit:
+            self.commit()
+
+    def get_basket_prices(self, codes: list[str]) -> list[tuple]:
+        """Returns (chain id, basket price, amount of items found) per chain, for the
+        basket of the given item codes, cheapest first. Items are priced at the
+        chain's cheapest store.
+        """
+        self.cursor.execute(
+            """
+            SELECT chain_id, SUM(min_price), COUNT(*)
+            FROM Chain_Item_Price
+            WHERE code = ANY(%s)
+            GROUP BY chain_id
+            ORDER BY COUNT(*) DESC, SUM(min_price)
+            """,
+            (codes,),
+        )
+
+        return self.get_rows()
+
+    @staticmethod
+    def prices_query(
+        chain_id: str = None,
+        store_id: str = None,
+        code: str = None,
+        limit: int = None,
+        after: tuple = None,
+    ) -> tuple[str, dict]:
+        """Returns the query and parameters selecting (code, name, chain id,
+        subchain id, store id, price, allow discount) rows of the current prices,
+        optionally filtered, in the order of Item_Instance's primary key.
+        Pages are read by keyset: `after` is the primary key of the previous page's
+        last row (see `price_key`), so a page costs the same however deep it is.
+        No limit if `limit` is None.
+        """
+        filters = {"chain_id": chain_id, "store_id": store_id, "code": code}
+        conditions = [
+            f"Item_Instance.{column} = %({column})s"
+            for column, value in filters.items()
+            if value is not None
+        ]
+
+        columns = TABLE_PRIMARY_KEY[TABLE.Item_Instance]
+        primary_key = ", ".join(f"Item_Instance.{column}" for column in columns)
+        # a row comparison, which an index scan of the primary key starts from
+        after_parameters = {}
+        if after is not None:
+            after_parameters = {
+                f"after_{column}": value for column, value in zip(columns, after)
+            }
+            conditions.append(
+                f"({primary_key}) > "
+                f"({', '.join(f'%({name})s' for name in after_parameters)})"
+            )
+
+        query = f"""
+            SELECT Item_Instance.code, Item.name, Item_Instance.chain_id,
+                Item_Instance.subchain_id, Item_Instance.store_id,
+                Item_Instance.price, Item_Instance.allow_discount
+            FROM Item_Instance
+            JOIN Item ON Item.code = Item_Instance.code
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY {primary_key}
+            LIMIT %(limit)s
+            """
+
+        return (query, {**filters, **after_parameters, "limit": limit})
+
+    @staticmethod
+    def price_key(row: tuple) -> tuple:
+        """Returns the Item_Instance primary key of a `prices_query` row."""
+        code, _, chain_id, subchain_id, store_id, *_ = row
+
+        return (code, store_id, chain_id, subchain_id)
+
+    def get_prices(
+        self,
+        chain_id: str = None,
+        store_id: str = None,
+        code: str = None,
+        *,
+        limit: int,
+        after: tuple = None,
+    ) -> list[tuple]:
+        """Returns a page of the current prices, see `prices_query`."""
+        self.cursor.execute(
+            *Database.prices_query(chain_id, store_id, code, limit, after)
         )
+
+        return self.get_rows()
+
+    def iterate_prices(
+        self, chain_id: str = None, store_id: str = None, code: str = None
+    ) -> Iterator[tuple]:
+        """Yields all the current prices (see `prices_query`) from a server side
+        cursor, fetching them in batches, so big results are never held whole.
+        """
+        with self.connection.cursor(name="prices") as cursor:
+            cursor.itersize = BATCH_SIZE
+            cursor.execute(*Database.prices_query(chain_id, store_id, code))
+            yield from cursor
+
+
+class AsyncDatabase:
+    """The asyncio counterpart of Database, for the ASGI server.
+    Borrows connections from a process-wide async pool.
+    """
+
+    pool: AsyncConnectionPool = None
+    # opening the pool awaits, so other coroutines must wait for it to be open
+    pool_lock = asyncio.Lock()
+
+    def __init__(self) -> None:
+        self.connection = None
+
+    @classmethod
+    async def get_pool(cls) -> AsyncConnectionPool:
+        async with cls.pool_lock:
+            if cls.pool is None:
+                pool = AsyncConnectionPool(
+                    **Database.pool_parameters(),
+                    check=AsyncConnectionPool.check_connection,
+                    name="zilazol-async",
+                    open=False,
+                )
+                await pool.open()
+                cls.pool = pool
+
+        return cls.pool
+
+    @classmethod
+    async def close_pool(cls):
+        if cls.pool is not None:
+            await cls.pool.close()
+            cls.pool = None
+
+    async def __aenter__(self):
+        self.connection = await (await AsyncDatabase.get_pool()).getconn()
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await (await AsyncDatabase.get_pool()).putconn(self.connection)
+        self.connection = None
+
+        return False  # dont suppress exceptions
+
+    async def iterate_prices(
+        self,
+        chain_id: str = None,
+        store_id: str = None,
+        code: str = None,
+        *,
+        limit: int = None,
+        after: tuple = None,
+    ) -> AsyncIterator[tuple]:
+        """Yields the current prices (see `Database.prices_query`) from a server
+        side cursor, so big results are never held whole.
+        """
+        async with self.connection.cursor(name="prices") as cursor:
+            await cursor.execute(
+                *Database.prices_query(chain_id, store_id, code, limit, after)
+            )
+            async for row in cursor:
+                yield row
+
+    @staticmethod
+    async def listen(channel: str) -> AsyncIterator[str]:
+        """Like `Database.listen`, without blocking the event loop."""
+        async with await psycopg.AsyncConnection.connect(
+            **Database.connection_parameters(), autocommit=True
+        ) as connection:
+            await connection.execute(f"LISTEN {channel}")
+            async for notification in connection.notifies():
+                yield notification.payload
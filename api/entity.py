@@ -1,11 +1,129 @@
+from array import array
+from collections import namedtuple
+from enum import Enum
+from itertools import compress
+from math import isnan, nan
+from typing import Callable, Iterable, Iterator
+import sys
+
+from constants import TABLE, TABLE_COLUMNS
+from utils import batched
+
+
 class Entity:
     """An entity. This can be an item, a promotion a store a subchain, or a chain."""
 
-    def __init__(self, data: dict) -> None:
+    def __init__(self, data: dict | tuple) -> None:
         self.data = data
 
     def __len__(self):
         return len(self.data)
 
     def to_value_tuple(self):
-        return tuple(i for i in self.data.values())
+        if isinstance(self.data, dict):
+            return tuple(i for i in self.data.values())
+        return tuple(self.data)
+
+
+# a record per table, with the table's columns as its fields. unlike a dict, a record
+# has no per row hash table of its keys, only its values.
+RECORD = {table: namedtuple(table.name, TABLE_COLUMNS[table]) for table in TABLE}
+
+# an item of a prices file, which is a row of both Item and Item_Instance
+ParsedItem = namedtuple(
+    "ParsedItem",
+    [
+        "chain_id",
+        "subchain_id",
+        "store_id",
+        "code",
+        "type",
+        "name",
+        "manufacturer_name",
+        "manufacture_country",
+        "manufacturer_item_description",
+        "unit_quantity",
+        "quantity",
+        "is_weighted",
+        "unit_of_measure",
+        "unit_of_measure_price",
+        "quantity_in_package",
+        "status",
+        "price",
+        "allow_discount",
+    ],
+)
+
+
+class EntityBatch:
+    """A batch of records of the same type, stored by field rather than by record.
+    Decimal fields are packed into arrays of doubles (None as NaN), and ids, which
+    repeat on every row of a store, are interned so the rows share them.
+    Database methods take a batch wherever they take entities.
+    """
+
+    FLOAT_FIELDS = {"quantity", "unit_of_measure_price", "price"}
+    INTERNED_FIELDS = {"chain_id", "subchain_id", "store_id"}
+
+    def __init__(self, record_type: type, records: Iterable[tuple] = ()) -> None:
+        self.record_type = record_type
+        self.columns = {
+            field: array("d") if field in EntityBatch.FLOAT_FIELDS else []
+            for field in record_type._fields
+        }
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return len(self.columns[self.record_type._fields[0]])
+
+    def extend(self, records: Iterable[tuple]):
+        # a batch of records at a time, so a lazy iterable is never held whole
+        for chunk in batched(records):
+            # transposes the records to their columns in C
+            for field, values in zip(self.record_type._fields, zip(*chunk)):
+                if field in EntityBatch.FLOAT_FIELDS:
+                    values = (nan if value is None else value for value in values)
+                elif field in EntityBatch.INTERNED_FIELDS:
+                    values = (
+                        value if value is None else sys.intern(value)
+                        for value in values
+                    )
+
+                self.columns[field].extend(values)
+
+    def column(self, field: str) -> list:
+        """Returns the values of a field, in the order of the records."""
+        values = self.columns[field]
+        if field in EntityBatch.FLOAT_FIELDS:
+            return [None if isnan(value) else value for value in values]
+
+        return values
+
+    def records(self) -> Iterator[tuple]:
+        fields = self.record_type._fields
+        return map(self.record_type._make, self.rows(fields, raw=True))
+
+    def rows(self, fields: tuple[str], *, raw: bool = False) -> Iterator[tuple]:
+        """Yields the values of the given fields of every record, enums as their values
+        unless `raw`.
+        """
+        columns = []
+        for field in fields:
+            values = self.column(field)
+            if not raw and any(isinstance(value, Enum) for value in values):
+                values = [
+                    value.value if isinstance(value, Enum) else value
+                    for value in values
+                ]
+            columns.append(values)
+
+        return zip(*columns)
+
+    def where(self, field: str, predicate: Callable[[object], bool]) -> "EntityBatch":
+        """Returns a batch of the records which field value satisfies the predicate."""
+        selectors = list(map(predicate, self.column(field)))
+        batch = EntityBatch(self.record_type)
+        for name, values in self.columns.items():
+            batch.columns[name].extend(compress(values, selectors))
+
+        return batch
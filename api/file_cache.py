@@ -0,0 +1,133 @@
+import os
+from os import environ
+from pathlib import Path
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import IO
+
+from utils import read_chunks
+
+DEFAULT_CACHE_DIRECTORY = Path.home() / ".cache" / "zilazol"
+DEFAULT_CACHE_MAX_SIZE = 2 * 1024**3  # bytes
+# eviction frees space down to this fraction of the max size, so it runs rarely
+EVICTION_TARGET = 0.9
+
+
+class FileCache:
+    """On-disk cache of raw (still compressed) downloaded files.
+    Every remote file is identified by a key - (server type, chain, category, file name,
+    timestamp) - which points to a blob named after the SHA-256 of its content, so
+    identical files are stored once. When the blobs grow past `max_size` bytes, the least
+    recently used ones are evicted, along with the keys pointing to them.
+    """
+
+    def __init__(self, directory: str = None, max_size: int = None) -> None:
+        self.directory = Path(
+            directory or environ.get("ZILAZOL_CACHE_DIR", DEFAULT_CACHE_DIRECTORY)
+        )
+        self.max_size = max_size or int(
+            environ.get("ZILAZOL_CACHE_MAX_SIZE", DEFAULT_CACHE_MAX_SIZE)
+        )
+        self.keys_directory = self.directory / "keys"
+        self.blobs_directory = self.directory / "blobs"
+        self.keys_directory.mkdir(parents=True, exist_ok=True)
+        self.blobs_directory.mkdir(parents=True, exist_ok=True)
+        self.eviction_lock = Lock()
+        self.size = self.get_blobs_size()  # kept up to date by put and evict
+
+    def key_path(self, key: tuple) -> Path:
+        name = sha256("\0".join(str(part) for part in key).encode()).hexdigest()
+
+        return self.keys_directory / name
+
+    def get(self, key: tuple) -> IO[bytes] | None:
+        """Returns the cached file of the key, or None if it is not cached."""
+        key_path = self.key_path(key)
+        try:
+            blob = self.blobs_directory / key_path.read_text()
+        except FileNotFoundError:  # never cached
+            return None
+
+        try:
+            file = open(blob, "rb")
+        except FileNotFoundError:  # evicted by another process
+            key_path.unlink(missing_ok=True)
+            return None
+
+        os.utime(blob)  # marks the blob as recently used
+
+        return file
+
+    def put(self, key: tuple, content: IO[bytes]) -> IO[bytes]:
+        """Stores (and closes) the content under the key, and returns the cached file."""
+        digest = sha256()
+        with content, NamedTemporaryFile(dir=self.directory, delete=False) as temp:
+            for chunk in read_chunks(content):
+                digest.update(chunk)
+                temp.write(chunk)
+
+        blob = self.blobs_directory / digest.hexdigest()
+        if blob.exists():
+            os.remove(temp.name)
+            os.utime(blob)
+        else:
+            size = os.path.getsize(temp.name)
+            os.replace(temp.name, blob)
+            with self.eviction_lock:
+                self.size += size
+
+        self.write_atomically(self.key_path(key), digest.hexdigest())
+        file = open(blob, "rb")
+        if self.size > self.max_size:
+            self.evict()
+
+        return file
+
+    def write_atomically(self, path: Path, text: str):
+        with NamedTemporaryFile("w", dir=self.directory, delete=False) as temp:
+            temp.write(text)
+
+        os.replace(temp.name, path)
+
+    def get_blobs_size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.blobs_directory))
+
+    def evict(self):
+        """Removes the least recently used blobs, and the keys pointing to them, until
+        the cache fits in `EVICTION_TARGET` of `max_size`. Lists the whole cache, so it
+        only runs once `max_size` is exceeded.
+        """
+        with self.eviction_lock:
+            blobs = []
+            for entry in os.scandir(self.blobs_directory):
+                stat = entry.stat()
+                blobs.append((stat.st_mtime, stat.st_size, entry.name))
+
+            # the real size, which other processes sharing the cache change as well
+            self.size = sum(size for _, size, _ in blobs)
+            evicted = set()
+            for _, size, name in sorted(blobs):
+                if self.size <= self.max_size * EVICTION_TARGET:
+                    break
+
+                try:
+                    os.remove(self.blobs_directory / name)
+                except OSError:  # still open, on Windows
+                    continue
+
+                self.size -= size
+                evicted.add(name)
+
+            if not evicted:
+                return
+
+            for entry in os.scandir(self.keys_directory):
+                try:
+                    with open(entry.path, "r") as key_file:
+                        digest = key_file.read()
+                except FileNotFoundError:
+                    continue
+
+                if digest in evicted:
+                    os.remove(entry.path)
@@ -2,20 +2,51 @@
 #       requests is the biggest one but used all along the file :(
 from abc import ABC, abstractmethod
 import requests
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from threading import Lock, BoundedSemaphore
 from datetime import datetime
 from bs4 import BeautifulSoup
-from lxml import etree
+from urllib.parse import urlparse
+from typing import IO, Iterator
 import json
 import time
 import re
 
 from constants import SERVER_TYPE, SERVER_TYPE_DATA, FILE_CATEGORY, CHAIN, CHAINS_DATA
 from data_file import DataFile
-from utils import unzip, ungzip
+from file_cache import FileCache
+from watermarks import Watermarks
+from utils import CHUNK_SIZE, spool, unzip_stream, ungzip_stream, transcode_xml
 
 
 class FileServer(ABC):
-    def __new__(cls, type: SERVER_TYPE) -> "FileServer":
+    # one pooled session per server type, shared by every instance of that type
+    sessions: dict[SERVER_TYPE, requests.Session] = {}
+    sessions_lock = Lock()
+    # the watermarks of servers not given their own, shared so their saves of the
+    # same file do not overwrite each other
+    default_watermarks: Watermarks = None
+    # bounds the parallel downloads from each server type, across all instances
+    download_slots = {
+        type: BoundedSemaphore(data["metadata"]["max_concurrent_downloads"])
+        for type, data in SERVER_TYPE_DATA.items()
+    }
+
+    # how many files are listed when probing for new ones
+    PROBE_AMOUNT = 100
+    file_name_time_pattern = re.compile(r"-(\d{12})(?!\d)")
+    file_name_store_pattern = re.compile(r"-(\d+)-\d{12}(?!\d)")
+
+    def __new__(
+        cls,
+        type: SERVER_TYPE,
+        concurrent: bool = True,
+        cache: FileCache = None,
+        watermarks: Watermarks = None,
+    ) -> "FileServer":
         match type:
             case SERVER_TYPE.Cerberus:
                 return super().__new__(FileServerCerberus)
@@ -30,11 +61,118 @@ class FileServer(ABC):
             case _:
                 raise ValueError(f"Unsupported server type: {type}")
 
-    def __init__(self, type: SERVER_TYPE) -> None:
+    def __init__(
+        self,
+        type: SERVER_TYPE,
+        concurrent: bool = True,
+        cache: FileCache = None,
+        watermarks: Watermarks = None,
+    ) -> None:
         self.type = type
+        self.concurrent = concurrent
+        self.cache = cache
+        self.watermarks = watermarks or FileServer.get_default_watermarks()
 
         self.server_data = SERVER_TYPE_DATA[type]
         self.base_url = self.server_data["metadata"]["domain"]
+        self.session = FileServer.get_session(type)
+
+    @staticmethod
+    def get_default_watermarks() -> Watermarks:
+        """Returns the watermarks shared by default, loaded on first use."""
+        with FileServer.sessions_lock:
+            if FileServer.default_watermarks is None:
+                FileServer.default_watermarks = Watermarks()
+
+        return FileServer.default_watermarks
+
+    @staticmethod
+    def get_session(type: SERVER_TYPE) -> requests.Session:
+        """Returns the keep-alive session of the server type, created on first use."""
+        with FileServer.sessions_lock:
+            session = FileServer.sessions.get(type)
+            if session is None:
+                session = FileServer.create_session(type)
+                FileServer.sessions[type] = session
+
+        return session
+
+    @staticmethod
+    def create_session(type: SERVER_TYPE) -> requests.Session:
+        pool = SERVER_TYPE_DATA[type]["metadata"]["connection_pool"]
+        adapter = HTTPAdapter(
+            pool_connections=pool["hosts"], pool_maxsize=pool["connections_per_host"]
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # the session is shared between chains, so cookies are never persisted
+        # in it - every request passes its own auth cookies explicitly
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        return session
+
+    def connection_stats(self) -> dict:
+        """Returns how many connections were opened and how many requests reused one."""
+        opened = requests_sent = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                requests_sent += pool.num_requests
+
+        return {
+            "requests": requests_sent,
+            "new_connections": opened,
+            "reused_connections": requests_sent - opened,
+        }
+
+    def iterate_downloads(self, file_list: list, download) -> Iterator[DataFile]:
+        """Lazily calls `download` on every file of the list, in parallel if
+        concurrent. Results keep the order of the list, and only a few downloads
+        run ahead of the consumer, so files are not all held at once.
+        """
+
+        def bounded_download(file):
+            with self.download_slots[self.type]:
+                return download(file)
+
+        if not self.concurrent or len(file_list) < 2:
+            yield from map(bounded_download, file_list)
+            return
+
+        max_workers = self.server_data["metadata"]["max_concurrent_downloads"]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for file in file_list:
+                pending.append(executor.submit(bounded_download, file))
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def get_data_file(
+        self, chain: CHAIN, category: FILE_CATEGORY, file: dict, fetch
+    ) -> DataFile:
+        """Downloads a listed file with `fetch` unless cached, and decompresses it."""
+        if self.cache is None:
+            content = fetch()
+        else:
+            name, timestamp = self.get_file_identity(file)
+            key = (self.type.name, chain.name, category.name, name, timestamp)
+            content = self.cache.get(key) or self.cache.put(key, fetch())
+
+        return DataFile(
+            content=self.decompress(content, category), chain=chain, category=category
+        )
+
+    @abstractmethod
+    def decompress(self, content: IO[bytes], category: FILE_CATEGORY) -> IO[bytes]:
+        """Returns the decompressed content of a downloaded file and closes it."""
+        raise NotImplementedError()
 
     @staticmethod
     def check_response(res: requests.Response):
@@ -66,22 +204,110 @@ class FileServer(ABC):
             CHAINS_DATA[chain]["server"]["domain_name"]
         )
 
-    @abstractmethod
     def get_files(
         self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
     ) -> list[DataFile]:
         """Gets a certain amount of files of a specific type."""
+        self.verify_chain(chain)
+        file_list = self.list_files(chain, category, amount, additional_data)
+
+        return self.get_listed_files(chain, category, file_list)
+
+    def get_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> list[DataFile]:
+        """Downloads files picked from the server's listing (see `list_files`)."""
+        return list(self.iterate_listed_files(chain, category, file_list))
+
+    @abstractmethod
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> Iterator[DataFile]:
+        """Lazily downloads files picked from the server's listing, in order."""
         raise NotImplementedError()
 
     @abstractmethod
-    def updated(self, category: FILE_CATEGORY) -> bool:
-        """Returns wether there are new files in the given category."""
+    def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        """Returns the server's listing of a certain amount of files of a type."""
         raise NotImplementedError()
 
     @abstractmethod
+    def get_file_identity(self, file: dict) -> tuple[str, str]:
+        """Returns the (file name, timestamp string) of a listed file."""
+        raise NotImplementedError()
+
+    def get_file_time(self, file: dict) -> datetime | None:
+        """Returns the time of a listed file, falling back to the time in its name."""
+        name, timestamp = self.get_file_identity(file)
+        if timestamp is not None:
+            try:
+                return self.string_datetime_converter(timestamp)
+            except (TypeError, ValueError):
+                pass
+
+        # file names end with -YYYYMMDDhhmm by regulation
+        match = self.file_name_time_pattern.search(name or "")
+        return None if match is None else datetime.strptime(match[1], "%Y%m%d%H%M")
+
+    def get_file_store(self, file: dict) -> str | None:
+        """Returns the id of the store a listed file belongs to, taken from its name
+        (<category><chain id>-<store id>-<time> by regulation), or None if the name
+        does not follow it.
+        """
+        name, _ = self.get_file_identity(file)
+        match = self.file_name_store_pattern.search(name or "")
+
+        return None if match is None else str(int(match[1]))
+
+    def get_latest_time(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict] = None
+    ) -> datetime | None:
+        """Returns the time of the newest file in the listing (listed if not given)."""
+        if file_list is None:
+            file_list = self.list_files(chain, category, self.PROBE_AMOUNT)
+
+        times = [time for time in map(self.get_file_time, file_list) if time]
+
+        return max(times, default=None)
+
+    def watermark_key(self, chain: CHAIN, category: FILE_CATEGORY) -> tuple:
+        return (self.type.name, chain.name, category.name)
+
+    def updated(self, chain: CHAIN, category: FILE_CATEGORY) -> bool:
+        """Returns wether there are new files in the given category of the chain,
+        i.e. files newer than the last ones marked with `mark_updated`.
+        Costs a single listing request, nothing is downloaded.
+        """
+        self.verify_chain(chain)
+        latest = self.get_latest_time(chain, category)
+        if latest is None:
+            return False
+
+        watermark = self.watermarks.get(self.watermark_key(chain, category))
+
+        return watermark is None or latest > watermark
+
+    def mark_updated(
+        self, chain: CHAIN, category: FILE_CATEGORY, files: list[dict] | datetime
+    ):
+        """Records that the listed files (or everything up to a time) were processed."""
+        if isinstance(files, datetime):
+            time = files
+        else:
+            time = self.get_latest_time(chain, category, files)
+
+        if time is not None:
+            self.watermarks.set(self.watermark_key(chain, category), time)
+
     def string_datetime_converter(self, value: str | datetime) -> str | datetime:
         """Converts the server's datetime representation to a string or the opposite."""
-        raise NotImplementedError()
+        datetime_format = self.server_data["metadata"]["datetime_format"]
+        if isinstance(value, datetime):
+            return value.strftime(datetime_format)
+
+        return datetime.strptime(value.strip(), datetime_format)
 
 
 class FileServerCerberus(FileServer):
@@ -91,37 +317,48 @@ class FileServerCerberus(FileServer):
     FILE_DOWNLOAD = "/file/d"
     SUBMIT = "Sign in"
 
-    def get_files(
-        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
-    ) -> list[DataFile]:
-        self.verify_chain(chain)
-        file_list, cftp = self.get_file_list(chain, category, amount, date=None)
-        return [
-            DataFile(
-                content=self.get_file_content(
-                    file["fname"], category == FILE_CATEGORY.Stores, cftp
-                ),
-                chain=chain,
-                category=category,
-            )
-            for file in file_list
-        ]
+    # (csrf, cftp, login time) per chain, shared by every instance
+    logins: dict[CHAIN, tuple[str, str, float]] = {}
+    login_locks = {chain: Lock() for chain in CHAIN}
+
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> Iterator[DataFile]:
+        return self.iterate_downloads(
+            file_list,
+            lambda file: self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(file["fname"], chain),
+            ),
+        )
 
-    def updated(self, category: FILE_CATEGORY) -> bool:
-        pass
+    def list_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
+    ) -> list[dict]:
+        return self.get_file_list(chain, category, amount, date=None)
 
-    def string_datetime_converter(self, value: str | datetime) -> str | datetime:
-        pass
+    def get_file_identity(self, file: dict) -> tuple[str, str]:
+        return (file["fname"], file.get("time"))
 
-    def get_file_content(self, file_name: str, is_xml: bool, cftp: str) -> bytes:
+    def get_file_content(self, file_name: str, chain: CHAIN) -> IO[bytes]:
         download_url = f"{self.base_url}{self.FILE_DOWNLOAD}/{file_name}"
-        res = requests.get(url=download_url, cookies={"cftpSID": cftp})
-        FileServer.check_response(res)
+        res = self.send_logged_in(
+            chain,
+            lambda csrf, cftp: self.session.get(
+                url=download_url, cookies={"cftpSID": cftp}, stream=True
+            ),
+        )
+
+        return spool(res.iter_content(CHUNK_SIZE))
 
-        if is_xml:
-            return res.content
+    def decompress(self, content: IO[bytes], category: FILE_CATEGORY) -> IO[bytes]:
+        if category == FILE_CATEGORY.Stores:  # stores files are plain XML
+            return content
 
-        return ungzip(res.content)
+        with content:
+            return ungzip_stream(content)
 
     def extract_csrf(self, content: bytes):
         soup = BeautifulSoup(content, "lxml")
@@ -133,7 +370,7 @@ class FileServerCerberus(FileServer):
         login_url = self.base_url + self.LOGIN
         user_url = self.base_url + self.LOGIN + self.USER
 
-        res = requests.get(url=login_url)
+        res = self.session.get(url=login_url)
         FileServer.check_response(res)
 
         csrf_token = self.extract_csrf(res.content)
@@ -151,11 +388,51 @@ class FileServerCerberus(FileServer):
         headers = {"Cookie": f"cftpSID={cftp_token}"}
 
         # /login/user redirects to /file
-        res = requests.post(url=user_url, params=login_params, headers=headers)
+        res = self.session.post(url=user_url, params=login_params, headers=headers)
         FileServer.check_response(res)
 
         return (self.extract_csrf(res.content), res.cookies.get("cftpSID"))
 
+    def get_login(self, chain: CHAIN, expired: tuple = None) -> tuple[str, str, float]:
+        """Returns the chain's cached (csrf, cftp, login time), logging in if needed.
+        `expired` is a login the server rejected; it is replaced unless already done.
+        """
+        max_age = self.server_data["metadata"]["login_max_age"]
+        with self.login_locks[chain]:
+            login = self.logins.get(chain)
+            if (
+                login is None
+                or login is expired
+                or time.monotonic() - login[2] > max_age
+            ):
+                login = (*self.login(chain), time.monotonic())
+                self.logins[chain] = login
+
+        return login
+
+    def is_logged_out(self, res: requests.Response) -> bool:
+        """Returns wether the request failed because the session is no longer valid."""
+        if res.status_code in (401, 403):
+            return True
+
+        # an expired session is redirected back to the login page
+        return urlparse(res.url).path.startswith(self.LOGIN)
+
+    def send_logged_in(self, chain: CHAIN, send) -> requests.Response:
+        """Sends a request using the chain's cached (csrf, cftp) tokens.
+        Logs in again and retries once if the server rejected the cached session.
+        """
+        login = self.get_login(chain)
+        res = send(login[0], login[1])
+        if self.is_logged_out(res):
+            res.close()
+            login = self.get_login(chain, expired=login)
+            res = send(login[0], login[1])
+
+        FileServer.check_response(res)
+
+        return res
+
     def get_file_list(
         self,
         chain: CHAIN,
@@ -164,25 +441,26 @@ class FileServerCerberus(FileServer):
         date: datetime = datetime.today(),
         store_id: str = None,
     ) -> list:
-        csrf, cftp = self.login(chain)
         body_params = {
             "iDisplayLength": amount,  # how many we want the server to return
             "mDataProp_1": "typeLabel",
             "sSearch_1": "file",  # we only want files
             "sSearch": self.get_search_string(chain, category, store_id, date),
-            "csrftoken": csrf,
         }
-        headers = {"Cookie": f"cftpSID={cftp}"}
 
-        res = requests.post(
-            url=self.base_url + self.FILE_LIST, headers=headers, data=body_params
+        res = self.send_logged_in(
+            chain,
+            lambda csrf, cftp: self.session.post(
+                url=self.base_url + self.FILE_LIST,
+                headers={"Cookie": f"cftpSID={cftp}"},
+                data={**body_params, "csrftoken": csrf},
+            ),
         )
-        FileServer.check_response(res)
 
         data = res.json()
         file_list = list(data.get("aaData"))
 
-        return file_list, cftp
+        return file_list
 
     def get_search_string(
         self,
@@ -201,39 +479,55 @@ class FileServerCerberus(FileServer):
 
         return string
 
-    def time_string_to_datetime(time: str):
-        return datetime.strptime(time, "%Y-%m-%dT%H:%M:%SZ")
-
 
 class FileServerShufersal(FileServer):
     SHUFERSAL_UPDATE_CATEGORY = "/FileObject/UpdateCategory"
 
-    def get_files(
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> Iterator[DataFile]:
+        return self.iterate_downloads(
+            file_list,
+            lambda file: self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(file["download_link"]),
+            ),
+        )
+
+    def list_files(
         self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
-    ) -> list[DataFile]:
-        self.verify_chain(chain)
+    ) -> list[dict]:
         self.get_affinity_tokens()
-        res = self.update_categories(category=category)
-        self.check_response(res)
-        file_list = self.get_file_list(res.content)
+        file_list = []
+        page = 1
+        while len(file_list) < amount:
+            res = self.update_categories(category=category, page=page)
+            if not self.add_page(file_list, self.get_file_list(res.content)):
+                break
 
-        return [
-            DataFile(
-                content=self.get_file_content(file["download_link"]),
-                chain=chain,
-                category=category,
-            )
-            for file in file_list[:amount]
-        ]
+            page += 1
 
-    def updated(self, category: FILE_CATEGORY) -> bool:
-        pass
+        return file_list[:amount]
 
-    def string_datetime_converter(self, value: str | datetime) -> str | datetime:
-        pass
+    @staticmethod
+    def add_page(file_list: list[dict], page_files: list[dict]) -> bool:
+        """Adds a page of the listing to the file list. Returns False past the last
+        page, which the server answers with no rows or with the last page again.
+        """
+        if not page_files or page_files[0] in file_list:
+            return False
+
+        file_list.extend(page_files)
+
+        return True
+
+    def get_file_identity(self, file: dict) -> tuple[str, str]:
+        return (self.get_file_name(file["download_link"]), file["timestamp"])
 
     def get_affinity_tokens(self):
-        res = requests.get(url=self.base_url)
+        res = self.session.get(url=self.base_url)
         self.check_response(res)
 
         ARRaffinity = res.cookies.get_dict().get("ARRAffinity")
@@ -245,9 +539,16 @@ class FileServerShufersal(FileServer):
         self,
         category=FILE_CATEGORY,
         store=0,  # All
+        page=1,  # the listing is paged, a page of 20 files
     ):
-        params = {"catID": self.get_category_parameter_name(category), "storeId": store}
-        res = requests.get(self.base_url + self.SHUFERSAL_UPDATE_CATEGORY, data=params)
+        params = {
+            "catID": self.get_category_parameter_name(category),
+            "storeId": store,
+            "page": page,
+        }
+        res = self.session.get(
+            self.base_url + self.SHUFERSAL_UPDATE_CATEGORY, data=params
+        )
         self.check_response(res)
 
         return res
@@ -280,11 +581,19 @@ class FileServerShufersal(FileServer):
 
         return file_list
 
-    def get_file_content(self, url_download: str) -> bytes:
-        res = requests.get(url=url_download)
+    def get_file_name(self, url_download: str) -> str:
+        # download links are signed blob urls, the file name is the path's last part
+        return urlparse(url_download).path.rsplit("/", 1)[-1]
+
+    def get_file_content(self, url_download: str) -> IO[bytes]:
+        res = self.session.get(url=url_download, stream=True)
         self.check_response(res)
 
-        return ungzip(res.content)
+        return spool(res.iter_content(CHUNK_SIZE))
+
+    def decompress(self, content: IO[bytes], category: FILE_CATEGORY) -> IO[bytes]:
+        with content:
+            return ungzip_stream(content)
 
     def get_prices(self, amount: int) -> list:
         self.get_affinity_tokens()
@@ -293,20 +602,18 @@ class FileServerShufersal(FileServer):
         file_list = self.get_file_list(res.content)
 
         return [
-            self.get_file_content(file["download_link"]) for file in file_list[:amount]
+            self.decompress(
+                self.get_file_content(file["download_link"]), FILE_CATEGORY.Prices
+            )
+            for file in file_list[:amount]
         ]
 
 
 class FileServerSuperPharm(FileServer):
     SUPER_PHARM_SESSION_COOKIE = "ci_session"
 
-    def hebrew_ascii_to_utf8(self, hebrew_bytes: bytes):
-        decoded_bytes = hebrew_bytes.decode("ISO-8859-8", errors="ignore")
-        parser = etree.XMLParser(encoding="utf-8")
-        root = etree.fromstring(decoded_bytes.encode("utf-8"), parser)
-        utf8_bytes = etree.tostring(root, pretty_print=True, encoding="utf-8")
-
-        return utf8_bytes
+    def hebrew_ascii_to_utf8(self, hebrew_stream: IO[bytes]) -> IO[bytes]:
+        return transcode_xml(hebrew_stream, "ISO-8859-8")
 
     def time_to_date_string(time: datetime = None):
         if time is None:
@@ -325,7 +632,7 @@ class FileServerSuperPharm(FileServer):
             "date": date,
             "store": "",  # for the meantime, this is "All"
         }
-        res = requests.get(self.base_url, params=params)
+        res = self.session.get(self.base_url, params=params)
         self.check_response(res)
 
         return (res, res.cookies.get_dict().get(self.SUPER_PHARM_SESSION_COOKIE))
@@ -358,25 +665,39 @@ class FileServerSuperPharm(FileServer):
 
         return file_list
 
-    def get_file_content(self, download_url: str, cookie: str) -> bytes:
+    def get_file_content(self, download_url: str, cookie: str) -> IO[bytes]:
         auth_cookie = {self.SUPER_PHARM_SESSION_COOKIE: cookie}
-        download_res = requests.get(
+        download_res = self.session.get(
             url=self.base_url + download_url, cookies=auth_cookie
         )
         self.check_response(download_res)
         download_descriptor = download_res.json()
-        res = requests.get(
-            url=self.base_url + download_descriptor["href"], cookies=auth_cookie
+        res = self.session.get(
+            url=self.base_url + download_descriptor["href"],
+            cookies=auth_cookie,
+            stream=True,
         )
         self.check_response(res)
 
-        unzipped = unzip(res.content)
-        encoding = self.get_encoding(unzipped)
+        return spool(res.iter_content(CHUNK_SIZE))
+
+    def decompress(self, content: IO[bytes], category: FILE_CATEGORY) -> IO[bytes]:
+        with content:
+            unzipped = unzip_stream(content)
+
+        return self.convert_encoding(unzipped)
+
+    def convert_encoding(self, stream: IO[bytes]) -> IO[bytes]:
+        """Converts the XML stream to UTF-8 according to its declared encoding."""
+        # the declaration is at the very start of the file
+        encoding = self.get_encoding(stream.read(CHUNK_SIZE))
+        stream.seek(0)
 
         if encoding == b"ISO-8859-8":
-            return self.hebrew_ascii_to_utf8(unzipped)
+            with stream:
+                return self.hebrew_ascii_to_utf8(stream)
         elif encoding == b"UTF-8":
-            return unzipped
+            return stream
 
     def get_encoding(self, content: bytes) -> str:
         match = re.search(rb'encoding=["\'](.*?)["\']', content)
@@ -385,34 +706,53 @@ class FileServerSuperPharm(FileServer):
         else:
             return None
 
-    def get_files(
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> Iterator[DataFile]:
+        return self.iterate_downloads(
+            file_list,
+            lambda file: self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(
+                    file["download_link"], file["session_cookie"]
+                ),
+            ),
+        )
+
+    def list_files(
         self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
-    ) -> list[DataFile]:
-        self.verify_chain(chain)
+    ) -> list[dict]:
         res, cookie = self.update_categories(category=category)
-        file_list = self.get_file_list(res.content)
 
+        # downloads are only allowed with the session the listing was made in
         return [
-            DataFile(
-                content=self.get_file_content(file["download_link"], cookie),
-                chain=chain,
-                category=category,
-            )
-            for file in file_list[:amount]
+            {**file, "session_cookie": cookie}
+            for file in self.get_file_list(res.content)[:amount]
         ]
 
-    def updated(self, category: FILE_CATEGORY) -> bool:
-        pass
-
-    def string_datetime_converter(self, value: str | datetime) -> str | datetime:
-        pass
+    def get_file_identity(self, file: dict) -> tuple[str, str]:
+        return (file["name"], file["timestamp"])
 
 
 class FileServerNibit(FileServer):
-    def get_files(
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> Iterator[DataFile]:
+        return self.iterate_downloads(
+            file_list,
+            lambda file: self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(file["download_link"]),
+            ),
+        )
+
+    def list_files(
         self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
-    ) -> list[DataFile]:
-        self.verify_chain(chain)
+    ) -> list[dict]:
         content = self.update_parameters(
             chain,
             category,
@@ -420,28 +760,21 @@ class FileServerNibit(FileServer):
             additional_data.get("subchain", "") if additional_data is not None else "",
             additional_data.get("store_id", "") if additional_data is not None else "",
         )
-        file_list = self.get_file_list(content, amount)
-
-        return [
-            DataFile(
-                content=ungzip(self.get_file_content(file["download_link"])),
-                chain=chain,
-                category=category,
-            )
-            for file in file_list
-        ]
 
-    def updated(self, category: FILE_CATEGORY) -> bool:
-        pass
+        return self.get_file_list(content, amount)
 
-    def string_datetime_converter(self, value: str | datetime) -> str | datetime:
-        pass
+    def get_file_identity(self, file: dict) -> tuple[str, str]:
+        return (file["name"], file["timestamp"])
 
-    def get_file_content(self, download_url: str) -> bytes:
-        res = requests.get(url=self.base_url + download_url)
+    def get_file_content(self, download_url: str) -> IO[bytes]:
+        res = self.session.get(url=self.base_url + download_url, stream=True)
         self.check_response(res)
 
-        return res.content
+        return spool(res.iter_content(CHUNK_SIZE))
+
+    def decompress(self, content: IO[bytes], category: FILE_CATEGORY) -> IO[bytes]:
+        with content:
+            return ungzip_stream(content)
 
     def get_file_list(self, content: bytes, amount: int) -> list:
         soup = BeautifulSoup(content, "lxml")
@@ -489,7 +822,7 @@ class FileServerNibit(FileServer):
             "fileType": self.get_category_parameter_name(category),
         }
 
-        res = requests.get(url=self.base_url, params=params)
+        res = self.session.get(url=self.base_url, params=params)
         FileServer.check_response(res)
 
         return res.content
@@ -501,40 +834,48 @@ class FileServerNibit(FileServer):
 
 class FileServerBinaProjects(FileServer):
 
-    def get_files(
+    def iterate_listed_files(
+        self, chain: CHAIN, category: FILE_CATEGORY, file_list: list[dict]
+    ) -> Iterator[DataFile]:
+        return self.iterate_downloads(
+            file_list,
+            lambda file: self.get_data_file(
+                chain,
+                category,
+                file,
+                lambda: self.get_file_content(chain, file["FileNm"]),
+            ),
+        )
+
+    def list_files(
         self, chain: CHAIN, category: FILE_CATEGORY, amount: int, additional_data=None
-    ) -> list[DataFile]:
-        self.verify_chain(chain)
+    ) -> list[dict]:
         file_list = self.update_parameters(
             chain=chain, category=category, date=datetime.today()
         )
 
-        return [
-            DataFile(
-                content=unzip(self.get_file_content(chain, file["FileNm"])),
-                chain=chain,
-                category=category,
-            )
-            for file in file_list
-        ]
+        return file_list[:amount]
 
-    def updated(self, category: FILE_CATEGORY) -> bool:
-        pass
-
-    def string_datetime_converter(self, value: str | datetime) -> str | datetime:
-        pass
+    def get_file_identity(self, file: dict) -> tuple[str, str]:
+        return (file["FileNm"], file.get("DateFile"))
 
-    def get_file_content(self, chain: CHAIN, filename: str) -> bytes:
+    def get_file_content(self, chain: CHAIN, filename: str) -> IO[bytes]:
         params = {"FileNm": filename}
-        download_url = requests.get(
+        download_url = self.session.get(
             url=self.get_subdomain_by_chain(chain) + "/Download.aspx", params=params
         )
         FileServer.check_response(download_url)
 
-        res = requests.get(url=json.loads(download_url.text)[0]["SPath"])
+        res = self.session.get(
+            url=json.loads(download_url.text)[0]["SPath"], stream=True
+        )
         FileServer.check_response(res)
 
-        return res.content
+        return spool(res.iter_content(CHUNK_SIZE))
+
+    def decompress(self, content: IO[bytes], category: FILE_CATEGORY) -> IO[bytes]:
+        with content:
+            return unzip_stream(content)
 
     def get_file_list(self, content: str, amount: int) -> list:
         return json.loads(content)[:amount]
@@ -552,7 +893,7 @@ class FileServerBinaProjects(FileServer):
             "WFileType": self.get_category_parameter_name(category),
             "WDate": "" if date is None else date.strftime("%d/%m/%Y"),
         }
-        res = requests.get(
+        res = self.session.get(
             url=self.get_subdomain_by_chain(chain) + "/MainIO_Hok.aspx", params=params
         )
         FileServer.check_response(res)
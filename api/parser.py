@@ -1,13 +1,18 @@
 from abc import ABC, abstractmethod
-import xmltodict
-from collections import defaultdict
+from functools import cache
+from operator import itemgetter
+from typing import Callable, Iterator
 import json
 
-from entity import Entity
+from lxml import etree
+
+from entity import RECORD, Entity, EntityBatch, ParsedItem
 from constants import *
 from data_file import DataFile
 from file_server import FileServer
-from process import derive_name, normalize_whitespace
+from file_cache import FileCache
+from price_columns import CodeTable, PriceColumns
+from process import normalize_whitespace
 
 
 SHUFERSAL_SUBCHAIN_NAME_FALLBACK = {
@@ -22,27 +27,91 @@ SHUFERSAL_SUBCHAIN_NAME_FALLBACK = {
     "3": "שערי רווחה",
 }
 
+# the fields of the item entity formats, in the order of ParserUtils.create_item's arguments
+ITEM_HEADER_FIELDS = ("subchain_id", "store_id")
+ITEM_FIELDS = (
+    "item_code",
+    "item_type",
+    "item_name",
+    "manufacturer_name",
+    "manufacture_country",
+    "manufacturer_item_description",
+    "unit_quantity",
+    "quantity",
+    "b_is_weighted",
+    "unit_of_measurement",
+    "unit_of_measurement_price",
+    "quantity_in_package",
+    "item_status",
+    "item_price",
+    "allow_discount",
+)
+
+
+class ItemsFormat:
+    """The items file format of a server type and category (see SERVER_TYPE_DATA),
+    resolved once into the item tag, the header tags and getters of the field values,
+    so parsing does no format lookups per item.
+    """
+
+    def __init__(self, format: dict) -> None:
+        file_format, entity_format = format["file"], format["entity"]
+
+        self.tag = file_format["entity_list"].split(" ")[-1]
+        self.header_tags = tuple(
+            file_format["header"][field] for field in ITEM_HEADER_FIELDS
+        )
+        self.get_header = ItemsFormat.compile_getter(self.header_tags)
+        self.get_fields = ItemsFormat.compile_getter(
+            tuple(entity_format[field] for field in ITEM_FIELDS)
+        )
+
+    @staticmethod
+    @cache
+    def get(server_type: SERVER_TYPE, category: FILE_CATEGORY) -> "ItemsFormat":
+        categories = SERVER_TYPE_DATA[server_type]["categories"]
+        return ItemsFormat(categories[category]["format"])
+
+    @staticmethod
+    def compile_getter(keys: tuple[str | None]) -> Callable[[dict], tuple]:
+        """Returns a function which gets the values of the keys from a dict, as a tuple.
+        None keys, of fields which a format does not have, get None.
+        """
+        if len(keys) > 1 and all(keys):
+            return itemgetter(*keys)  # done in C
+
+        getters = [itemgetter(key) if key else lambda _: None for key in keys]
+        return lambda entity: tuple(get(entity) for get in getters)
+
 
 class BaseParser(ABC):
     """Defines an interface for a parser which every server type needs to implement."""
 
-    @abstractmethod
     def parse_items_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
-    ) -> list[Entity]:
-        """Returns the item list parsed from the given file."""
-        pass
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
+    ) -> Iterator[ParsedItem]:
+        """Lazily yields the items parsed from the given file, by its format."""
+        format = ItemsFormat.get(server_type, file.category)
+        get_header, get_fields = format.get_header, format.get_fields
+        create_item = ParserUtils.create_item
+
+        return (
+            create_item(chain_id, *get_header(header), *get_fields(item))
+            for item, header in ParserUtils.iterate_entities(
+                file, format.tag, format.header_tags
+            )
+        )
 
     @abstractmethod
     def parse_promos_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> list[Entity]:
         """Returns the promo list parsed from the given file."""
         pass
 
     @abstractmethod
     def parse_stores_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> tuple[list[Entity], list[Entity]]:
         """Returns the subchain list and store list parsed from the given file."""
         pass
@@ -50,82 +119,46 @@ class BaseParser(ABC):
 
 class ParserCerberus(BaseParser):
 
-    def parse_items_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
-    ) -> list[dict]:
-        root = data.get("Root", data.get("root"))
-        item_list = root["Items"]["Item"]
-        subchain_id = root["SubChainId"]
-        store_id = root["StoreId"]
-
-        return [
-            ParserUtils.create_item(
-                chain_id,
-                subchain_id,
-                store_id,
-                item["ItemCode"],
-                item["ItemType"],
-                item["ItemName"],
-                item["ManufacturerName"],
-                item["ManufactureCountry"],
-                item["ManufacturerItemDescription"],
-                item["UnitQty"],
-                item["Quantity"],
-                item["bIsWeighted"],
-                item["UnitOfMeasure"],
-                item["UnitOfMeasurePrice"],
-                item["QtyInPackage"],
-                item["ItemStatus"],
-                item["ItemPrice"],
-                item["AllowDiscount"],
-            )
-            for item in item_list
-        ]
-
     def parse_promos_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> list[Entity]:
         pass
 
     def parse_stores_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> tuple[list[Entity], list[Entity]]:
-        subchain_list = data["Root"]["SubChains"]["SubChain"]
-        if isinstance(subchain_list, dict):
-            subchain_list = [subchain_list]
-
+        subchain_cache = set()
         subchains = []
         stores = []
 
-        for subchain in subchain_list:
-            subchains.append(
-                Entity(
-                    ParserUtils.create_subchain(
-                        subchain["SubChainId"], chain_id, subchain["SubChainName"]
+        for store, subchain in ParserUtils.iterate_entities(
+            file, "Store", ("SubChainId", "SubChainName")
+        ):
+            subchain_id = subchain["SubChainId"]
+            if not subchain_id in subchain_cache:
+                subchain_cache.add(subchain_id)
+                subchains.append(
+                    Entity(
+                        ParserUtils.create_subchain(
+                            subchain_id, chain_id, subchain["SubChainName"]
+                        )
                     )
                 )
-            )
-            store_list = subchain["Stores"]["Store"]
-            if isinstance(store_list, dict):
-                store_list = [store_list]
 
-            stores.extend(
-                [
-                    Entity(
-                        ParserUtils.create_store(
-                            store["StoreId"],
-                            chain_id,
-                            subchain["SubChainId"],
-                            store["BikoretNo"],
-                            store["StoreType"],
-                            store["StoreName"],
-                            store["Address"],
-                            store["City"],
-                            store["ZipCode"],
-                        )
+            stores.append(
+                Entity(
+                    ParserUtils.create_store(
+                        store["StoreId"],
+                        chain_id,
+                        subchain_id,
+                        store["BikoretNo"],
+                        store["StoreType"],
+                        store["StoreName"],
+                        store["Address"],
+                        store["City"],
+                        store["ZipCode"],
                     )
-                    for store in store_list
-                ]
+                )
             )
 
         return (subchains, stores)
@@ -133,54 +166,18 @@ class ParserCerberus(BaseParser):
 
 class ParserShufersal(BaseParser):
 
-    def parse_items_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
-    ) -> list[Entity]:
-        root = data.get("Root", data.get("root"))
-        item_list = root["Items"]["Item"]
-        subchain_id = root["SubChainId"]
-        store_id = root["StoreId"]
-
-        return [
-            ParserUtils.create_item(
-                chain_id,
-                subchain_id,
-                store_id,
-                item["ItemCode"],
-                item["ItemType"],
-                item["ItemName"],
-                item["ManufacturerName"],
-                item["ManufactureCountry"],
-                item["ManufacturerItemDescription"],
-                item["UnitQty"],
-                item["Quantity"],
-                item["bIsWeighted"],
-                item["UnitOfMeasure"],
-                item["UnitOfMeasurePrice"],
-                item["QtyInPackage"],
-                item["ItemStatus"],
-                item["ItemPrice"],
-                item["AllowDiscount"],
-            )
-            for item in item_list
-        ]
-
     def parse_promos_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> list[Entity]:
         pass
 
     def parse_stores_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> tuple[list[Entity], list[Entity]]:
         subchain_cache = set()
         stores = []
         subchains = []
-        store_list = data["asx:abap"]["asx:values"]["STORES"]["STORE"]
-        if isinstance(store_list, dict):
-            store_list = [store_list]
-
-        for store in store_list:
+        for store, _ in ParserUtils.iterate_entities(file, "STORE"):
             subchain_id = str(int(store["SUBCHAINID"]))
             if not subchain_id in subchain_cache:
                 subchain_cache.add(subchain_id)
@@ -216,51 +213,18 @@ class ParserShufersal(BaseParser):
 
 class ParserSuperPharm(BaseParser):
 
-    def parse_items_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
-    ) -> list[Entity]:
-        root = data["OrderXml"]["Envelope"]
-        item_list = root["Header"]["Details"]["Line"]
-        subchain_id = root["SubChainId"]
-        store_id = root["StoreId"]
-
-        return [
-            ParserUtils.create_item(
-                chain_id,
-                subchain_id,
-                store_id,
-                item["ItemCode"],
-                "1",  # Normal
-                item["ItemName"],
-                item["ManufacturerName"],
-                item["ManufactureCountry"],
-                item["ManufacturerItemDescription"],
-                item["UnitQty"],
-                item["Quantity"],
-                item["blsWeighted"],
-                item["UnitOfMeasure"],
-                item["UnitOfMeasurePrice"],
-                item["QtyInPackage"],
-                item["ItemStatus"],
-                item["ItemPrice"],
-                item["AllowDiscount"],
-            )
-            for item in item_list
-        ]
-
     def parse_promos_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> list[Entity]:
         pass
 
     def parse_stores_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> tuple[list[Entity], list[Entity]]:
-        root = data["OrderXml"]["Envelope"]
-        store_list = root["Header"]["Details"]["Line"]
-        if isinstance(store_list, dict):
-            store_list = [store_list]
-
+        store_list = list(
+            ParserUtils.iterate_entities(file, "Line", ("ChainId", "SubChainId"))
+        )
+        _, root = store_list[0]
         chain_id = root["ChainId"]
         subchain_id = root["SubChainId"]
 
@@ -278,14 +242,14 @@ class ParserSuperPharm(BaseParser):
                     store["ZipCode"],
                 )
             )
-            for store in store_list
+            for store, _ in store_list
         ]
 
         return (
             [
                 Entity(
                     ParserUtils.create_subchain(
-                        subchain_id, chain_id, store_list[0]["SubChainName"]
+                        subchain_id, chain_id, store_list[0][0]["SubChainName"]
                     ),
                 )
             ],
@@ -295,54 +259,18 @@ class ParserSuperPharm(BaseParser):
 
 class ParserNibit(BaseParser):
 
-    def parse_items_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
-    ) -> list[Entity]:
-        root = data["Prices"]
-        item_list = root["Products"]["Product"]
-        subchain_id = root["SubChainID"]
-        store_id = root["StoreID"]
-
-        return [
-            ParserUtils.create_item(
-                chain_id,
-                subchain_id,
-                store_id,
-                item["ItemCode"],
-                item["ItemType"],
-                item["ItemName"],
-                item["ManufactureName"],
-                item["ManufactureCountry"],
-                item["ManufactureItemDescription"],
-                item["UnitQty"],
-                item["Quantity"],
-                item["BisWeighted"],
-                item["UnitMeasure"],
-                item["UnitOfMeasurePrice"],
-                item["QtyInPackage"],
-                item["itemStatus"],
-                item["ItemPrice"],
-                item["AllowDiscount"],
-            )
-            for item in item_list
-        ]
-
     def parse_promos_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> list[Entity]:
         pass
 
     def parse_stores_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> tuple[list[Entity], list[Entity]]:
         subchain_cache = set()
         stores = []
         subchains = []
-        store_list = data["Store"]["Branches"]["Branch"]
-        if isinstance(store_list, dict):
-            store_list = [store_list]
-
-        for store in store_list:
+        for store, _ in ParserUtils.iterate_entities(file, "Branch"):
             subchain_id = str(int(store["SubChainID"]))
             if not subchain_id in subchain_cache:
                 subchain_cache.add(subchain_id)
@@ -377,84 +305,46 @@ class ParserNibit(BaseParser):
 
 class ParserBinaProjects(BaseParser):
 
-    def parse_items_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
-    ) -> list[Entity]:
-        root = data["Root"]
-        item_list = root["Items"]["Item"]
-        subchain_id = root["SubChainId"]
-        store_id = root["StoreId"]
-
-        return [
-            ParserUtils.create_item(
-                chain_id,
-                subchain_id,
-                store_id,
-                item["ItemCode"],
-                item["ItemType"],
-                item["ItemNm"],
-                item["ManufacturerName"],
-                item["ManufactureCountry"],
-                item["ManufacturerItemDescription"],
-                item["UnitQty"],
-                item["Quantity"],
-                item["bIsWeighted"],
-                item["UnitOfMeasure"],
-                item["UnitOfMeasurePrice"],
-                item["QtyInPackage"],
-                item["ItemStatus"],
-                item["ItemPrice"],
-                item["AllowDiscount"],
-            )
-            for item in item_list
-        ]
-
     def parse_promos_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> list[Entity]:
         pass
 
     def parse_stores_file(
-        self, file: DataFile, data: dict, server_type: SERVER_TYPE, chain_id: str
+        self, file: DataFile, server_type: SERVER_TYPE, chain_id: str
     ) -> tuple[list[Entity], list[Entity]]:
-        subchain_list = data["Root"]["SubChains"]["SubChain"]
-        if isinstance(subchain_list, dict):
-            subchain_list = [subchain_list]
-
+        subchain_cache = set()
         subchains = []
         stores = []
 
-        for subchain in subchain_list:
-            subchains.append(
-                Entity(
-                    ParserUtils.create_subchain(
-                        subchain["SubChainId"],
-                        chain_id,
-                        subchain["SubChainName"],
+        for store, subchain in ParserUtils.iterate_entities(
+            file, "Store", ("SubChainId", "SubChainName")
+        ):
+            subchain_id = subchain["SubChainId"]
+            if not subchain_id in subchain_cache:
+                subchain_cache.add(subchain_id)
+                subchains.append(
+                    Entity(
+                        ParserUtils.create_subchain(
+                            subchain_id, chain_id, subchain["SubChainName"]
+                        )
                     )
                 )
-            )
-            store_list = subchain["Stores"]["Store"]
-            if isinstance(store_list, dict):
-                store_list = [store_list]
 
-            stores.extend(
-                [
-                    Entity(
-                        ParserUtils.create_store(
-                            store["StoreId"],
-                            chain_id,
-                            subchain["SubChainId"],
-                            store["BikoretNo"],
-                            store["StoreType"],
-                            store["StoreName"],
-                            store["Address"],
-                            store["City"],
-                            store["ZipCode"],
-                        )
+            stores.append(
+                Entity(
+                    ParserUtils.create_store(
+                        store["StoreId"],
+                        chain_id,
+                        subchain_id,
+                        store["BikoretNo"],
+                        store["StoreType"],
+                        store["StoreName"],
+                        store["Address"],
+                        store["City"],
+                        store["ZipCode"],
                     )
-                    for store in store_list
-                ]
+                )
             )
 
         return (subchains, stores)
@@ -472,25 +362,75 @@ class Parser:
 
     def parse(
         self, file: DataFile
-    ) -> list[Entity] | tuple[list[Entity], list[Entity]] | list[dict]:
-        """Returns all the entities in the file."""
-        data = xmltodict.parse(file.content)
+    ) -> Iterator[ParsedItem] | tuple[list[Entity], list[Entity]] | list[Entity]:
+        """Returns all the entities in the file. Items are yielded lazily."""
         server_type = CHAINS_DATA[file.chain]["server"]["type"]
         chain_id = CHAINS_DATA[file.chain]["id"]
 
         parser: BaseParser = self.parsers[server_type]
         match FILE_CATEGORY_TO_ENTITY_TYPE[file.category]:
             case ENTITY_TYPE.Item:
-                return parser.parse_items_file(file, data, server_type, chain_id)
+                return parser.parse_items_file(file, server_type, chain_id)
             case ENTITY_TYPE.Promo:
-                return parser.parse_promos_file(file, data, server_type, chain_id)
+                return parser.parse_promos_file(file, server_type, chain_id)
             case ENTITY_TYPE.Store:
-                return parser.parse_stores_file(file, data, server_type, chain_id)
+                return parser.parse_stores_file(file, server_type, chain_id)
             case _:
                 raise Exception("Invalid entity type")
 
+    def parse_columns(self, file: DataFile, codes: CodeTable) -> PriceColumns:
+        """Returns the items of a prices file as NumPy columns, for vectorised
+        analysis. Codes are encoded with (and added to) the given code table.
+        """
+        if FILE_CATEGORY_TO_ENTITY_TYPE[file.category] != ENTITY_TYPE.Item:
+            raise Exception("Invalid entity type")
+
+        return PriceColumns.from_batch(EntityBatch(ParsedItem, self.parse(file)), codes)
+
 
 class ParserUtils:
+    @staticmethod
+    def iterate_entities(
+        file: DataFile, tag: str, header_tags: tuple[str] = ()
+    ) -> Iterator[tuple[dict, dict]]:
+        """Streams the file, yielding every `tag` element as a {child tag: text} dict
+        along with the latest values of the header tags read so far (e.g. the store id
+        of a prices file). Elements are freed once read, so memory stays flat.
+        """
+        header = dict.fromkeys(header_tags)
+        for _, element in etree.iterparse(
+            file.open(), events=("end",), remove_comments=True, huge_tree=True
+        ):
+            tag_name = ParserUtils.local_name(element)
+            if tag_name == tag:
+                yield (
+                    {
+                        ParserUtils.local_name(child): ParserUtils.element_text(child)
+                        for child in element
+                    },
+                    header,
+                )
+
+                # free the element and the already read siblings before it
+                element.clear(keep_tail=False)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+            elif (
+                tag_name in header
+                and ParserUtils.local_name(element.getparent()) != tag
+            ):
+                header = {**header, tag_name: ParserUtils.element_text(element)}
+
+    @staticmethod
+    def local_name(element) -> str:
+        """Returns the tag of the element without its namespace."""
+        return element.tag.rpartition("}")[2]
+
+    @staticmethod
+    def element_text(element) -> str | None:
+        text = element.text
+        return text.strip() or None if text else None
+
     @staticmethod
     def create_store(
         id: str,
@@ -502,26 +442,26 @@ class ParserUtils:
         address: str,
         city: str,
         zip_code: str,
-    ) -> dict:
-        return {
-            "id": ParserUtils.normalize_number(id),
-            "chain_id": chain_id,
-            "subchain_id": ParserUtils.normalize_number(subchain_id),
-            "bikoret_number": ParserUtils.parse_store_bikoret_number(bikoret_number),
-            "type": ParserUtils.parse_store_type(type).value,
-            "name": name or "",
-            "address": address or None,
-            "city": city or None,
-            "zip_code": ParserUtils.parse_store_zip_code(zip_code),
-        }
+    ) -> tuple:
+        return RECORD[TABLE.Store](
+            id=ParserUtils.normalize_number(id),
+            chain_id=chain_id,
+            subchain_id=ParserUtils.normalize_number(subchain_id),
+            bikoret_number=ParserUtils.parse_store_bikoret_number(bikoret_number),
+            type=ParserUtils.parse_store_type(type).value,
+            name=name or "",
+            address=address or None,
+            city=city or None,
+            zip_code=ParserUtils.parse_store_zip_code(zip_code),
+        )
 
     @staticmethod
-    def create_subchain(id: str, chain_id: str, name: str) -> dict:
-        return {
-            "id": ParserUtils.normalize_number(id),
-            "chain_id": chain_id,
-            "name": name or "",
-        }
+    def create_subchain(id: str, chain_id: str, name: str) -> tuple:
+        return RECORD[TABLE.Subchain](
+            id=ParserUtils.normalize_number(id),
+            chain_id=chain_id,
+            name=name or "",
+        )
 
     @staticmethod
     def create_item(
@@ -534,7 +474,7 @@ class ParserUtils:
         manufacturer_name: str,
         manufacture_country: str,
         manufacturer_item_description: str,
-        quantity_unit: str,
+        unit_quantity: str,
         quantity: str,
         is_weighted: str,
         unit_of_measure: str,
@@ -543,29 +483,29 @@ class ParserUtils:
         status: str,
         price: str,
         allow_discount: str,
-    ):
-        return {
-            "chain_id": chain_id,
-            "subchain_id": ParserUtils.normalize_number(subchain_id),
-            "store_id": ParserUtils.normalize_number(store_id),
-            "code": normalize_whitespace(code),
-            "type": ParserUtils.parse_item_type(type),
-            "name": normalize_whitespace(name),
-            "manufacturer_name": normalize_whitespace(manufacturer_name),
-            "manufacture_country": normalize_whitespace(manufacture_country),
-            "manufacturer_item_description": normalize_whitespace(
+    ) -> ParsedItem:
+        return ParsedItem(
+            chain_id=chain_id,
+            subchain_id=ParserUtils.normalize_number(subchain_id),
+            store_id=ParserUtils.normalize_number(store_id),
+            code=normalize_whitespace(code),
+            type=ParserUtils.parse_item_type(type),
+            name=normalize_whitespace(name),
+            manufacturer_name=normalize_whitespace(manufacturer_name),
+            manufacture_country=normalize_whitespace(manufacture_country),
+            manufacturer_item_description=normalize_whitespace(
                 manufacturer_item_description
             ),
-            "quantity_unit": ParserUtils.parse_unit(quantity_unit),
-            "quantity": ParserUtils.parse_decimal(quantity),
-            "is_weighted": ParserUtils.parse_bool(is_weighted),
-            "unit_of_measure": normalize_whitespace(unit_of_measure),
-            "unit_of_measure_price": ParserUtils.parse_decimal(unit_of_measure_price),
-            "quantity_in_package": ParserUtils.parse_number(quantity_in_package),
-            "status": ParserUtils.parse_item_status(status),
-            "price": ParserUtils.parse_decimal(price),
-            "allow_discount": ParserUtils.parse_bool(allow_discount),
-        }
+            unit_quantity=ParserUtils.parse_unit(unit_quantity),
+            quantity=ParserUtils.parse_decimal(quantity),
+            is_weighted=ParserUtils.parse_bool(is_weighted),
+            unit_of_measure=normalize_whitespace(unit_of_measure),
+            unit_of_measure_price=ParserUtils.parse_decimal(unit_of_measure_price),
+            quantity_in_package=ParserUtils.parse_number(quantity_in_package),
+            status=ParserUtils.parse_item_status(status),
+            price=ParserUtils.parse_decimal(price),
+            allow_discount=ParserUtils.parse_bool(allow_discount),
+        )
 
     @staticmethod
     def parse_bool(bool: str) -> bool:
@@ -582,7 +522,7 @@ class ParserUtils:
     def normalize_number(number: str) -> str | None:
         try:
             return str(int(number))
-        except ValueError:
+        except (TypeError, ValueError):
             return None
 
     @staticmethod
@@ -623,11 +563,11 @@ class ParserUtils:
     @staticmethod
     def parse_item_status(status: str) -> ITEM_STATUS:
         match ParserUtils.normalize_number(status):
-            case ITEM_STATUS.Updated:
+            case ITEM_STATUS.Updated.value:
                 return ITEM_STATUS.Updated
-            case ITEM_STATUS.Removed:
+            case ITEM_STATUS.Removed.value:
                 return ITEM_STATUS.Removed
-            case ITEM_STATUS.Added:
+            case ITEM_STATUS.Added.value:
                 return ITEM_STATUS.Added
             case _:
                 return ITEM_STATUS.Updated
@@ -703,7 +643,10 @@ def enum_decoder(dct):
 
 
 if __name__ == "__main__":
-    servers = {server_type: FileServer(server_type) for server_type in SERVER_TYPE}
+    cache = FileCache()
+    servers = {
+        server_type: FileServer(server_type, cache=cache) for server_type in SERVER_TYPE
+    }
     price_files = {
         chain: servers[CHAINS_DATA[chain]["server"]["type"]].get_files(
             chain=chain, category=FILE_CATEGORY.PricesFull, amount=1
@@ -713,7 +656,7 @@ if __name__ == "__main__":
     }
 
     parser = Parser()
-    a = parser.parse(price_files[CHAIN.ZolVeBegadol][0])
+    a = list(parser.parse(price_files[CHAIN.ZolVeBegadol][0]))
 
     pass
 
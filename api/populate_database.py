@@ -7,14 +7,12 @@ def populate():
 
 
 def populate_chains():
-    values = [(CHAINS_DATA[chain]["id"], chain.name) for chain in CHAINS_DATA.keys()]
+    chains = [
+        {"id": CHAINS_DATA[chain]["id"], "name": chain.name}
+        for chain in CHAINS_DATA.keys()
+    ]
     with Database() as db:
-        db.execute_many(
-            """
-            INSERT INTO Chain VALUES (%s, %s);
-            """,
-            values,
-        )
+        db.upsert_entities(TABLE.Chain, chains)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+from typing import Iterable
+
+import numpy as np
+
+from entity import EntityBatch
+
+
+class CodeTable:
+    """Dictionary encoding of item codes: every distinct code gets a small int id.
+    A table is shared by the files of an analysis, so ids compare across them.
+    """
+
+    def __init__(self) -> None:
+        self.codes: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def encode(self, codes: list[str]) -> np.ndarray:
+        ids = self.ids
+        for code in codes:
+            if code not in ids:
+                ids[code] = len(self.codes)
+                self.codes.append(code)
+
+        return np.fromiter(map(ids.__getitem__, codes), np.int32, len(codes))
+
+    def decode(self, ids: np.ndarray) -> np.ndarray:
+        return np.array(self.codes, dtype=object)[ids]
+
+
+class PriceColumns:
+    """The prices of one or more files as NumPy columns, a row per item instance.
+    `code` holds ids of the code table and `store` holds indexes into `stores`, the
+    distinct (chain id, subchain id, store id) of the rows. Decimals are float64,
+    with NaN where a file had no valid value.
+    """
+
+    def __init__(
+        self,
+        codes: CodeTable,
+        code: np.ndarray,
+        stores: list[tuple[str, str, str]],
+        store: np.ndarray,
+        price: np.ndarray,
+        quantity: np.ndarray,
+        unit_of_measure_price: np.ndarray,
+    ) -> None:
+        self.codes = codes
+        self.code = code
+        self.stores = stores
+        self.store = store
+        self.price = price
+        self.quantity = quantity
+        self.unit_of_measure_price = unit_of_measure_price
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+    @staticmethod
+    def from_batch(batch: EntityBatch, codes: CodeTable) -> "PriceColumns":
+        store_indexes = {}
+        store = np.fromiter(
+            (
+                store_indexes.setdefault(key, len(store_indexes))
+                for key in batch.rows(("chain_id", "subchain_id", "store_id"))
+            ),
+            np.int32,
+            len(batch),
+        )
+
+        # the batch's decimals are arrays of doubles already, NaN for None
+        return PriceColumns(
+            codes,
+            codes.encode(batch.columns["code"]),
+            list(store_indexes),
+            store,
+            np.array(batch.columns["price"], dtype=np.float64),
+            np.array(batch.columns["quantity"], dtype=np.float64),
+            np.array(batch.columns["unit_of_measure_price"], dtype=np.float64),
+        )
+
+    @staticmethod
+    def concatenate(columns_list: Iterable["PriceColumns"]) -> "PriceColumns":
+        """Joins the columns of several files, which must share a code table."""
+        columns_list = list(columns_list)
+        if not columns_list:
+            raise ValueError("There are no columns to join")
+
+        codes = columns_list[0].codes
+        if any(columns.codes is not codes for columns in columns_list):
+            raise ValueError("Columns must share a code table to be joined")
+
+        store_indexes = {}
+        stores = []
+        for columns in columns_list:
+            # the indexes of the columns' stores among the joined stores
+            indexes = np.array(
+                [
+                    store_indexes.setdefault(key, len(store_indexes))
+                    for key in columns.stores
+                ],
+                dtype=np.int32,
+            )
+            stores.append(indexes[columns.store])
+
+        return PriceColumns(
+            codes,
+            np.concatenate([columns.code for columns in columns_list]),
+            list(store_indexes),
+            np.concatenate(stores),
+            np.concatenate([columns.price for columns in columns_list]),
+            np.concatenate([columns.quantity for columns in columns_list]),
+            np.concatenate(
+                [columns.unit_of_measure_price for columns in columns_list]
+            ),
+        )
@@ -0,0 +1,176 @@
+"""The /api/prices routes without a web framework: validation of their arguments
+and encoding of their responses. Shared by the Flask (server.py) and the ASGI
+(asgi.py) servers, so both answer a request with the same bytes, and ETags.
+"""
+
+import base64
+import csv
+import io
+import json
+
+from constants import CHAIN, CHAINS_DATA
+from database import Database
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_TTL = 5 * 60  # seconds, in case an invalidation is missed
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = [
+    "code",
+    "name",
+    "chain",
+    "subchain_id",
+    "store_id",
+    "price",
+    "allow_discount",
+]
+
+CHAIN_BY_ID = {data["id"]: chain for chain, data in CHAINS_DATA.items()}
+
+
+def get_int_argument(
+    args: dict, name: str, default: int, minimum: int, maximum: int = None
+) -> int:
+    value = args.get(name, str(default))
+    if not value.isdigit():
+        raise ValueError(f"{name} must be a number")
+
+    value = int(value)
+    if value < minimum:
+        raise ValueError(f"{name} must be equal or greater than {minimum}")
+
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{name} must be equal or less than {maximum}")
+
+    return value
+
+
+def encode_cursor(row: tuple) -> str:
+    """Returns the opaque cursor of the page after a row of /api/prices."""
+    key = json.dumps(Database.price_key(row))
+
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Returns the primary key an /api/prices cursor points after."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+    if (
+        not isinstance(key, list)
+        or len(key) != 4
+        or not all(isinstance(value, str) for value in key)
+    ):
+        raise ValueError("Invalid cursor")
+
+    return tuple(key)
+
+
+def parse_prices_arguments(args: dict) -> dict:
+    """Validates the query arguments of /api/prices and returns them normalised.
+    Throws ValueError on invalid arguments.
+    """
+    chain = args.get("chain", None)
+    if chain is not None and chain not in CHAIN.__members__:
+        raise ValueError("Invalid chain")
+
+    after = args.get("after", None)
+
+    return {
+        "chain": chain,
+        "store": args.get("store", None),
+        "code": args.get("code", None),
+        "after": decode_cursor(after) if after is not None else None,
+        "page_size": get_int_argument(args, "page_size", PAGE_SIZE, 1, MAX_PAGE_SIZE),
+    }
+
+
+def prices_query_arguments(arguments: dict) -> dict:
+    """Returns the Database.get_prices arguments of parsed /api/prices arguments."""
+    chain = arguments["chain"]
+
+    return {
+        "chain_id": CHAINS_DATA[CHAIN[chain]]["id"] if chain is not None else None,
+        "store_id": arguments["store"],
+        "code": arguments["code"],
+        "limit": arguments["page_size"],
+        "after": arguments["after"],
+    }
+
+
+def next_cursor(arguments: dict, count: int, last_row: tuple) -> str | None:
+    """Returns the cursor of the page after one of `count` rows, or None if it was
+    the last page.
+    """
+    if count < arguments["page_size"]:
+        return None
+
+    return encode_cursor(last_row)
+
+
+def price_to_dict(row: tuple) -> dict:
+    code, name, chain_id, subchain_id, store_id, price, allow_discount = row
+
+    return {
+        "code": code,
+        "name": name,
+        "chain": CHAIN_BY_ID[chain_id.strip()].name,
+        "subchain_id": subchain_id,
+        "store_id": store_id,
+        "price": float(price),
+        "allow_discount": allow_discount,
+    }
+
+
+def encode_prices_page(arguments: dict, rows: list[tuple]) -> bytes:
+    """Returns the JSON body of a page of /api/prices."""
+    return json.dumps(
+        {
+            "page_size": arguments["page_size"],
+            "prices": [price_to_dict(row) for row in rows],
+            # passed as `after` to get the next page
+            "next": next_cursor(arguments, len(rows), rows[-1] if rows else None),
+        }
+    ).encode()
+
+
+def parse_export_arguments(args: dict) -> tuple[str, str]:
+    """Validates the query arguments of /api/prices/export and returns the chain and
+    format. Throws ValueError on invalid arguments.
+    """
+    chain = args.get("chain", None)
+    format = args.get("format", "ndjson")
+
+    if chain not in CHAIN.__members__:
+        raise ValueError("Invalid chain")
+
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    return (chain, format)
+
+
+def encode_export_header(format: str) -> bytes:
+    """Returns the start of a prices export, before its rows."""
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, EXPORT_FIELDS).writeheader()
+        return buffer.getvalue().encode()
+
+    return b""
+
+
+def encode_export_rows(rows: list[tuple], format: str) -> bytes:
+    """Returns a batch of rows of a prices export, encoded."""
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, EXPORT_FIELDS).writerows(map(price_to_dict, rows))
+        return buffer.getvalue().encode()
+
+    return "".join(json.dumps(price_to_dict(row)) + "\n" for row in rows).encode()
@@ -1,9 +1,16 @@
 import re
-from collections import defaultdict
-import sys, io
+from collections import Counter, defaultdict
+from functools import lru_cache
+import sys
 from constants import *
 from Levenshtein import jaro_winkler
 
+try:
+    from rapidfuzz.distance import JaroWinkler
+    from rapidfuzz.process import cdist
+except ImportError:  # optional, token pairs are then scored one by one
+    cdist = None
+
 
 # tokens which number of names divided by their number of occurrences above this threshold are taken into the final name.
 TOKEN_RATIO_THRESHOLD = 0.33
@@ -12,22 +19,80 @@ TOKEN_RATIO_THRESHOLD = 0.33
 # we will take the longest among them.
 TOKEN_SIMILARITY_THRESHOLD = 0.8
 
+# below this many distinct tokens, scoring the pairs one by one is cheaper than batching them.
+# the crossover measured by `python benchmark.py scoring_crossover` on synthetic names.
+BATCHED_SCORING_MIN_TOKENS = 8
+
+# how many distinct strings the normalisers remember. item fields such as manufacturer names
+# and item names repeat across stores and files, so most calls are hits.
+NORMALIZE_CACHE_SIZE = 1 << 16
+
+
+sys.stdout.reconfigure(encoding="utf-8")
 
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
 
-whitespace_pattern = re.compile(r"\s+|-")
+def trie_pattern(words: list[str]) -> str:
+    """Returns a regex alternation of the words, factored by their common prefixes,
+    so the regex engine tries every prefix once instead of once per word.
+    Longer words are tried before their prefixes.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for character in word:
+            node = node.setdefault(character, {})
+        node[""] = {}  # a word ends here
+
+    def node_pattern(node: dict) -> str:
+        alternatives = [
+            re.escape(character) + node_pattern(child)
+            for character, child in node.items()
+            if character
+        ]
+        if not alternatives:
+            return ""
+
+        if len(alternatives) == 1 and "" not in node:
+            return alternatives[0]
+
+        return f"(?:{'|'.join(alternatives)})" + ("?" if "" in node else "")
+
+    return node_pattern(trie)
+
 
 blacklist = UNIT_HEBREW
-blacklist_pattern = "|".join(map(re.escape, blacklist))
+blacklist_pattern = trie_pattern(blacklist)
 
 # dont ask, it works
 pattern = rf"(\d+\.?\d*) ?({blacklist_pattern})\b(?!%)|\b({blacklist_pattern}) ?(\d+\.?\d*)\b(?!%)"
 units_pattern = re.compile(pattern)
 
 
-def derive_name(name_list: list[str]) -> str:
+def get_similar_tokens(token_list: list[str]) -> list[list[int]]:
+    """Returns the indexes of the tokens similar to each token of the list.
+    All the pairs are scored in a single call, in C, rather than a call per pair.
+    """
+    scores = cdist(
+        token_list,
+        token_list,
+        scorer=JaroWinkler.similarity,
+        score_cutoff=TOKEN_SIMILARITY_THRESHOLD,
+    )
+
+    # only the (few) similar pairs are visited in Python, in row major order
+    similar_tokens = [[] for _ in token_list]
+    for i, j in zip(*(indexes.tolist() for indexes in scores.nonzero())):
+        if i != j:
+            similar_tokens[i].append(j)
+
+    return similar_tokens
+
+
+def derive_name(name_list: list[str], *, exhaustive: bool = False) -> str:
     """Gets the most "common" or logical name derived from the given name list.
     It is assumed that the names are whitespace-normalized (stripped with only single spaces).
+    Token pairs are scored in a batch, unless there are few tokens, `exhaustive` is set (as
+    a reference) or rapidfuzz is not installed, in which case they are scored one by one.
     """
     name_count = len(name_list)
     derived_tokens = defaultdict(float)
@@ -37,24 +102,35 @@ def derive_name(name_list: list[str]) -> str:
 
     # count all instances of each token
     for name in name_list:
-        tokens = normalize_whitespace(units_pattern.sub("", name)).split(" ")
+        tokens = tokenize_name(name)
         for i in range(len(tokens)):
             token_instances[tokens[i]].append(i)
 
     token_list = list(token_instances.keys())
-    for token in token_list:
+    exhaustive = (
+        exhaustive or cdist is None or len(token_list) < BATCHED_SCORING_MIN_TOKENS
+    )
+    similar_token_indexes = None if exhaustive else get_similar_tokens(token_list)
+    for i, token in enumerate(token_list):
         if token in merged_tokens:
             continue
 
-        unmerged_tokens = [
-            j for j in token_list if not j in merged_tokens and j != token
-        ]
-
-        similar_tokens = [
-            other
-            for other in unmerged_tokens
-            if jaro_winkler(token, other, score_cutoff=TOKEN_SIMILARITY_THRESHOLD)
-        ]
+        if exhaustive:
+            unmerged_tokens = [
+                j for j in token_list if not j in merged_tokens and j != token
+            ]
+
+            similar_tokens = [
+                other
+                for other in unmerged_tokens
+                if jaro_winkler(token, other, score_cutoff=TOKEN_SIMILARITY_THRESHOLD)
+            ]
+        else:
+            similar_tokens = [
+                token_list[j]
+                for j in similar_token_indexes[i]
+                if not token_list[j] in merged_tokens
+            ]
 
         if len(similar_tokens) != 0:
             # get the longest token
@@ -84,7 +160,7 @@ def derive_name(name_list: list[str]) -> str:
         # average index - maybe give indexes which are abnormal less weight
         derived_tokens[token] = sum(indexes) / number_of_occurrences
 
-        index_count = {i: indexes.count(i) for i in indexes}
+        index_count = Counter(indexes)
         index_weights = {i: index_count[i] / number_of_occurrences for i in index_count}
         weighted_mean_sum = sum(
             key * index_count[key] * index_weights[key] for key in index_count
@@ -97,9 +173,21 @@ def derive_name(name_list: list[str]) -> str:
     )
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def tokenize_name(name: str) -> tuple[str, ...]:
+    """Splits a name into its tokens, without units and quantities."""
+    return tuple(
+        units_pattern.sub("", name).replace("-", " ").replace("&", " אנד ").split()
+    )
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_whitespace(text: str) -> str | None:
+    """Replaces dashes with spaces and "&" with "אנד", strips the text and collapses
+    whitespace runs to single spaces. Results are interned, so repeated values such as
+    manufacturer names share a single string.
+    """
     if text:
-        return whitespace_pattern.sub(
-            " ", text.replace("-", " ").replace("&", " אנד ").strip()
-        )
+        # split and join collapse every whitespace run at once, and strip the ends
+        return sys.intern(" ".join(text.replace("-", " ").replace("&", " אנד ").split()))
     return None
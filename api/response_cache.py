@@ -0,0 +1,62 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class ResponseCache:
+    """A size bounded LRU cache of response bodies which expire after `ttl` seconds.
+    Every body is stored with its ETag, so unchanged responses can be answered with
+    304 Not Modified.
+    A body is put with the `generation` read before its query, and dropped if the
+    cache was invalidated meanwhile, since it may predate the invalidating ingest.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (body, etag, expiry time), least recently used first
+        self.entries: OrderedDict[tuple, tuple[bytes, str, float]] = OrderedDict()
+        self.lock = Lock()
+        self.hits = self.misses = 0
+        self.generation = 0  # incremented by every invalidation
+
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        return hashlib.sha1(body).hexdigest()
+
+    def get(self, key: tuple) -> tuple[bytes, str] | None:
+        """Returns the (body, etag) cached under the key, if there is a fresh one."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[:2]
+
+    def put(self, key: tuple, body: bytes, generation: int) -> str:
+        """Caches a body under the key, unless it is of an older generation, and
+        returns its etag.
+        """
+        etag = ResponseCache.make_etag(body)
+        with self.lock:
+            if generation != self.generation:
+                return etag
+
+            self.entries[key] = (body, etag, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return etag
+
+    def invalidate(self):
+        """Drops every entry, e.g. after new prices were loaded."""
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
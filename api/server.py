@@ -1,33 +1,85 @@
-from flask import Flask, jsonify, request, abort
+from flask import Flask, request, abort, stream_with_context
 from flask_cors import CORS
-from get_cerberus_data import get_chain_prices, CERBERUS_CHAINS
-from api.process_data import prices_to_dict
-from db import get_unique_names
+from threading import Lock, Thread
+import time
+
+from constants import CHAIN, CHAINS_DATA, PRICES_UPDATED_CHANNEL
+from database import Database
+from prices_api import (
+    EXPORT_FORMATS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    encode_export_header,
+    encode_export_rows,
+    encode_prices_page,
+    parse_export_arguments,
+    parse_prices_arguments,
+    prices_query_arguments,
+)
+from response_cache import ResponseCache
+from utils import batched, gzip_chunks
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:5173"}}, supports_credentials=True)
 
-@app.route('/api/prices', methods=['GET'])
-def get_prices():
-    chain = request.args.get("chain", None)
-    amount = request.args.get("amount", "1")
+cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+listener_started = False
+listener_lock = Lock()
+
+
+def listen_for_ingests():
+    """Empties the response cache whenever an ingest commits new prices."""
+    while True:
+        try:
+            for _ in Database.listen(PRICES_UPDATED_CHANNEL):
+                cache.invalidate()
+        except Exception as e:
+            app.logger.warning(f"Lost the ingest notifications connection: {e}")
+            # whatever was committed meanwhile would be missed
+            cache.invalidate()
+            time.sleep(5)
 
-    if not chain or chain not in CERBERUS_CHAINS.keys():
-        abort(400, description="Invalid chain")
 
-    if not amount.isdigit():
-        abort(400, description="Amount must be a number")
+@app.before_request
+def start_ingest_listener():
+    """Starts listening for ingests on the first request, in whichever process
+    serves the app.
+    """
+    global listener_started
+    with listener_lock:
+        if listener_started:
+            return
+
+        listener_started = True
+
+    Thread(target=listen_for_ingests, name="ingest-listener", daemon=True).start()
+
+
+@app.route('/api/prices', methods=['GET'])
+def get_prices():
+    try:
+        arguments = parse_prices_arguments(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
 
-    amount = int(amount)
-    if amount < 1:
-        abort(400, description="Amount equal or greater than 1")
+    # the normalised query, so equivalent requests share an entry
+    key = (request.path, *arguments.values())
+    cached = cache.get(key)
+    if cached is not None:
+        body, etag = cached
+    else:
+        generation = cache.generation
+        with Database() as db:
+            rows = db.get_prices(**prices_query_arguments(arguments))
 
-    names = get_unique_names(
-        [prices_to_dict(prices) for chain_name in CERBERUS_CHAINS.keys() for prices in get_chain_prices(chain_name, 1)],
-        10
-    )
+        body = encode_prices_page(arguments, rows)
+        etag = cache.put(key, body, generation)
 
-    res = jsonify(names)
+    res = app.response_class(body, mimetype="application/json")
+    # clients revalidate with If-None-Match and get 304 while nothing changed
+    res.set_etag(etag)
+    res.headers["Cache-Control"] = "no-cache"
+    res.make_conditional(request)
 
     # allow CORS
     res.headers.add('Access-Control-Allow-Origin', '*')
@@ -38,5 +90,37 @@ def get_prices():
     return res
 
 
+@app.route('/api/prices/export', methods=['GET'])
+def export_prices():
+    """Streams all the current prices of a chain, as NDJSON or CSV."""
+    try:
+        chain, format = parse_export_arguments(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    def generate():
+        yield encode_export_header(format)
+        # rows come from a server side cursor, so memory use does not grow
+        with Database() as db:
+            rows = db.iterate_prices(chain_id=CHAINS_DATA[CHAIN[chain]]["id"])
+            for batch in batched(rows):
+                yield encode_export_rows(batch, format)
+
+    chunks = generate()
+    gzipped = request.accept_encodings["gzip"] > 0
+    if gzipped:
+        chunks = gzip_chunks(chunks)
+
+    res = app.response_class(stream_with_context(chunks), mimetype=EXPORT_FORMATS[format])
+    if gzipped:
+        res.headers["Content-Encoding"] = "gzip"
+        res.headers["Vary"] = "Accept-Encoding"
+
+    res.headers["Content-Disposition"] = f"attachment; filename={chain}.{format}"
+    res.headers.add('Access-Control-Allow-Origin', '*')
+
+    return res
+
+
 if __name__ == '__main__':
     app.run(debug=True)
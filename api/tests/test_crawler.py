@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from constants import CHAIN, FILE_CATEGORY, ITEM_STATUS, SERVER_TYPE, TABLE
+from crawler import Crawler
+from entity import ParsedItem
+from file_server import FileServer
+from watermarks import Watermarks
+
+START = datetime(2026, 10, 18, 3, 0)
+
+
+def item(store: str, code: str, price: float, status=ITEM_STATUS.Updated):
+    return ParsedItem(
+        "7290027600007", "1", store, code, 1, f"item {code}", "", "", "", "",
+        1.0, False, "unit", price, 1, status, price, True,
+    )
+
+
+def listed(category: FILE_CATEGORY, store: str, hours: int, items: list) -> dict:
+    prefix = "PriceFull" if category == FILE_CATEGORY.PricesFull else "Price"
+    time = START + timedelta(hours=hours)
+    return {
+        "name": f"{prefix}7290027600007-{int(store):03}-{time:%Y%m%d%H%M}",
+        "items": items,
+    }
+
+
+class StubServer(FileServer):
+    """Lists the given files, newest first like the servers, and 'downloads' a
+    file as the file itself.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, watermarks: Watermarks) -> None:
+        super().__init__(SERVER_TYPE.Shufersal, watermarks=watermarks)
+        self.listings = {FILE_CATEGORY.PricesFull: [], FILE_CATEGORY.Prices: []}
+        self.downloaded = []
+
+    def list_files(self, chain, category, amount, additional_data=None):
+        files = sorted(self.listings[category], key=lambda file: file["name"][-12:])
+        return files[::-1][:amount]
+
+    def iterate_listed_files(self, chain, category, file_list):
+        for file in file_list:
+            self.downloaded.append(file["name"])
+            yield file
+
+    def get_file_identity(self, file):
+        return (file["name"], None)
+
+    def decompress(self, content, category):
+        return content
+
+
+class StubParser:
+    def parse(self, file):
+        return iter(file["items"])
+
+
+class StubDatabase:
+    """Keeps the prices of Item_Instance by (store, code)."""
+
+    def __init__(self) -> None:
+        self.prices = {}
+
+    def upsert_entities(self, table, entities, *, update=True, commit=True):
+        if table == TABLE.Item_Instance:
+            for record in entities.records():
+                self.prices[(record.store_id, record.code)] = record.price
+
+    def delete_entities(self, table, entities, *, commit=True):
+        for record in entities.records():
+            self.prices.pop((record.store_id, record.code), None)
+
+    def delete_store_items_except(
+        self, chain_id, subchain_id, store_id, codes, *, commit=True
+    ):
+        for key in [key for key in self.prices if key[0] == store_id]:
+            if key[1] not in codes:
+                del self.prices[key]
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def crawler(tmp_path):
+    crawler = Crawler(StubDatabase(), watermarks=Watermarks(tmp_path / "marks.json"))
+    crawler.parser = StubParser()
+    crawler.server = StubServer(crawler.get_server(CHAIN.Shufersal).watermarks)
+    crawler.servers = {SERVER_TYPE.Shufersal: crawler.server}
+
+    return crawler
+
+
+def store_watermark(crawler: Crawler, store: str) -> datetime:
+    return crawler.get_store_watermark(crawler.server, CHAIN.Shufersal, store)
+
+
+def test_bootstrap_loads_every_store_with_a_full_file(crawler):
+    crawler.server.listings[FILE_CATEGORY.PricesFull] = [
+        listed(FILE_CATEGORY.PricesFull, "1", 0, [item("1", "a", 1.0)]),
+        listed(FILE_CATEGORY.PricesFull, "2", 1, [item("2", "a", 2.0)]),
+        listed(FILE_CATEGORY.PricesFull, "2", -24, [item("2", "old", 9.0)]),
+    ]
+
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    # store 1 has no deltas listed, and is loaded all the same
+    assert crawler.db.prices == {("1", "a"): 1.0, ("2", "a"): 2.0}
+    assert store_watermark(crawler, "1") == START
+    assert store_watermark(crawler, "2") == START + timedelta(hours=1)
+
+
+def test_deltas_are_applied_in_order(crawler):
+    full = listed(FILE_CATEGORY.PricesFull, "1", 0, [item("1", "a", 1.0)])
+    crawler.server.listings[FILE_CATEGORY.PricesFull] = [full]
+    crawler.server.listings[FILE_CATEGORY.Prices] = [
+        listed(FILE_CATEGORY.Prices, "1", -1, [item("1", "stale", 5.0)]),
+        listed(
+            FILE_CATEGORY.Prices, "1", 2, [item("1", "b", 3.0, ITEM_STATUS.Removed)]
+        ),
+        listed(
+            FILE_CATEGORY.Prices,
+            "1",
+            1,
+            [item("1", "a", 1.5), item("1", "b", 2.0, ITEM_STATUS.Added)],
+        ),
+    ]
+
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    assert crawler.db.prices == {("1", "a"): 1.5}
+    assert crawler.server.downloaded == [
+        full["name"],
+        "Price7290027600007-001-202610180400",
+        "Price7290027600007-001-202610180500",
+    ]
+    assert store_watermark(crawler, "1") == START + timedelta(hours=2)
+
+
+def test_rerun_without_new_files_does_nothing(crawler):
+    crawler.server.listings[FILE_CATEGORY.PricesFull] = [
+        listed(FILE_CATEGORY.PricesFull, "1", 0, [item("1", "a", 1.0)])
+    ]
+    crawler.server.listings[FILE_CATEGORY.Prices] = [
+        listed(FILE_CATEGORY.Prices, "1", 1, [item("1", "a", 1.5)])
+    ]
+    crawler.crawl_prices(CHAIN.Shufersal)
+    crawler.server.downloaded.clear()
+
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    assert crawler.server.downloaded == []
+    assert crawler.db.prices == {("1", "a"): 1.5}
+
+
+def test_gap_in_a_cut_listing_bootstraps_the_store_again(crawler):
+    crawler.server.listings[FILE_CATEGORY.PricesFull] = [
+        listed(
+            FILE_CATEGORY.PricesFull, "1", 0, [item("1", "a", 1.0), item("1", "b", 1.0)]
+        )
+    ]
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    # the delta of hour 1 dropped out of a listing cut to two files
+    crawler.LISTING_AMOUNT = 2
+    crawler.server.listings[FILE_CATEGORY.PricesFull].append(
+        listed(FILE_CATEGORY.PricesFull, "1", 2, [item("1", "a", 2.0)])
+    )
+    crawler.server.listings[FILE_CATEGORY.Prices] = [
+        listed(FILE_CATEGORY.Prices, "1", 1, [item("1", "a", 9.0)]),
+        listed(FILE_CATEGORY.Prices, "1", 2, [item("1", "a", 2.0)]),
+        listed(FILE_CATEGORY.Prices, "1", 3, [item("1", "c", 3.0, ITEM_STATUS.Added)]),
+    ]
+    crawler.server.downloaded.clear()
+
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    # b was removed by the missing deltas, which only the newer full file shows
+    assert crawler.db.prices == {("1", "a"): 2.0, ("1", "c"): 3.0}
+    assert crawler.server.downloaded == [
+        "PriceFull7290027600007-001-202610180500",
+        "Price7290027600007-001-202610180600",
+    ]
+
+
+def test_gap_without_a_newer_full_file_skips_the_deltas(crawler):
+    crawler.server.listings[FILE_CATEGORY.PricesFull] = [
+        listed(FILE_CATEGORY.PricesFull, "1", 0, [item("1", "a", 1.0)])
+    ]
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    crawler.LISTING_AMOUNT = 1
+    crawler.server.listings[FILE_CATEGORY.Prices] = [
+        listed(FILE_CATEGORY.Prices, "1", 1, [item("1", "a", 9.0)]),
+        listed(FILE_CATEGORY.Prices, "1", 2, [item("1", "a", 2.0)]),
+    ]
+    crawler.server.downloaded.clear()
+
+    crawler.crawl_prices(CHAIN.Shufersal)
+
+    assert crawler.server.downloaded == []
+    assert crawler.db.prices == {("1", "a"): 1.0}
+    assert store_watermark(crawler, "1") == START
@@ -0,0 +1,146 @@
+"""Tests of the merge SQL against a real database, with db/schema.sql applied.
+They only run when POSTGRES_PASSWORD is set, and roll everything back.
+"""
+
+from decimal import Decimal
+from os import environ
+
+import pytest
+
+from constants import TABLE
+from database import Database
+
+pytestmark = pytest.mark.skipif(
+    "POSTGRES_PASSWORD" not in environ, reason="needs the zilazol database"
+)
+
+CHAIN_ID = "9999999999999"
+
+
+def instance(code: str, price: str) -> dict:
+    return {
+        "code": code,
+        "store_id": "1",
+        "chain_id": CHAIN_ID,
+        "subchain_id": "1",
+        "type": "normal",
+        "price": Decimal(price),
+        "allow_discount": True,
+    }
+
+
+@pytest.fixture
+def db():
+    with Database() as db:
+        # committed, so the partitions outlive the rolled back tests
+        db.manage_history_partitions()
+        db.upsert_entities(
+            TABLE.Chain, [{"id": CHAIN_ID, "name": "Test chain"}], commit=False
+        )
+        db.upsert_entities(
+            TABLE.Subchain,
+            [{"id": "1", "chain_id": CHAIN_ID, "name": "Test subchain"}],
+            commit=False,
+        )
+        db.upsert_entities(
+            TABLE.Store,
+            [
+                {
+                    "id": "1",
+                    "chain_id": CHAIN_ID,
+                    "subchain_id": "1",
+                    "bikoret_number": "1",
+                    "type": "physical",
+                    "name": "Test store",
+                    "address": None,
+                    "city": None,
+                    "zip_code": None,
+                }
+            ],
+            commit=False,
+        )
+        db.upsert_entities(
+            TABLE.Item,
+            [
+                {
+                    "code": code,
+                    "name": f"Test item {code}",
+                    "manufacturer_name": None,
+                    "manufacture_country": None,
+                    "manufacturer_item_description": None,
+                    "unit_quantity": "unit",
+                    "quantity": Decimal(1),
+                    "is_weighted": False,
+                    "quantity_in_package": 1,
+                }
+                for code in ("test-a", "test-b")
+            ],
+            commit=False,
+        )
+
+        # never committed, the pool rolls the connection back when it is returned
+        yield db
+
+
+def price_of(db: Database, code: str) -> tuple:
+    db.cursor.execute(
+        """
+        SELECT price, ctid FROM Item_Instance
+        WHERE chain_id = %s AND store_id = '1' AND subchain_id = '1' AND code = %s
+        """,
+        (CHAIN_ID, code),
+    )
+
+    return db.get_rows(1)
+
+
+def history_of(db: Database, code: str) -> list[Decimal]:
+    db.cursor.execute(
+        "SELECT price FROM Price_History WHERE chain_id = %s AND code = %s",
+        (CHAIN_ID, code),
+    )
+
+    return [price for (price,) in db.get_rows()]
+
+
+def test_last_duplicate_of_a_load_wins(db):
+    written = db.upsert_entities(
+        TABLE.Item_Instance,
+        [instance("test-a", "1.00"), instance("test-a", "2.00")],
+        commit=False,
+    )
+
+    assert written == 1
+    assert price_of(db, "test-a")[0] == Decimal("2.00")
+    assert history_of(db, "test-a") == [Decimal("2.00")]
+
+
+def test_unchanged_rows_are_not_rewritten(db):
+    db.upsert_entities(
+        TABLE.Item_Instance,
+        [instance("test-a", "1.00"), instance("test-b", "1.00")],
+        commit=False,
+    )
+    unchanged = price_of(db, "test-a")
+
+    written = db.upsert_entities(
+        TABLE.Item_Instance,
+        [instance("test-a", "1.00"), instance("test-b", "3.00")],
+        commit=False,
+    )
+
+    assert written == 1
+    # an update would have written a new version of the row elsewhere
+    assert price_of(db, "test-a") == unchanged
+    assert price_of(db, "test-b")[0] == Decimal("3.00")
+    assert history_of(db, "test-a") == [Decimal("1.00")]
+    assert sorted(history_of(db, "test-b")) == [Decimal("1.00"), Decimal("3.00")]
+
+
+def test_identical_reload_writes_nothing(db):
+    load = [instance("test-a", "1.00"), instance("test-b", "2.00")]
+    db.upsert_entities(TABLE.Item_Instance, load, commit=False)
+
+    assert db.upsert_entities(TABLE.Item_Instance, load, commit=False) == 0
+    assert history_of(db, "test-a") == [Decimal("1.00")]
+    assert history_of(db, "test-b") == [Decimal("2.00")]
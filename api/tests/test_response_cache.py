@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import asgi
+import response_cache
+import server
+from prices_api import parse_prices_arguments
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(max_entries=4, ttl=10)
+    etag = cache.put(("a",), b"body", cache.generation)
+
+    clock[0] += 9
+    assert cache.get(("a",)) == (b"body", etag)
+
+    clock[0] += 2
+    assert cache.get(("a",)) is None
+    assert ("a",) not in cache.entries
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put(("a",), b"a", cache.generation)
+    cache.put(("b",), b"b", cache.generation)
+    cache.get(("a",))
+
+    cache.put(("c",), b"c", cache.generation)
+
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is not None
+    assert cache.get(("c",)) is not None
+
+
+def test_put_of_an_older_generation_is_dropped():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    generation = cache.generation  # read before the query
+    cache.invalidate()  # an ingest commits while the query runs
+
+    etag = cache.put(("a",), b"stale", generation)
+
+    assert etag == ResponseCache.make_etag(b"stale")
+    assert cache.get(("a",)) is None
+
+    cache.put(("a",), b"fresh", cache.generation)
+    assert cache.get(("a",))[0] == b"fresh"
+
+
+def test_invalidate_drops_every_entry():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put(("a",), b"a", cache.generation)
+
+    cache.invalidate()
+
+    assert cache.get(("a",)) is None
+
+
+def cached_page(cache: ResponseCache, query: dict) -> str:
+    """Caches a body for the /api/prices query, as a handler would, so no database
+    is queried. Returns its etag.
+    """
+    key = ("/api/prices", *parse_prices_arguments(query).values())
+    return cache.put(key, b'{"prices": []}', cache.generation)
+
+
+def test_flask_answers_a_matching_etag_with_not_modified(monkeypatch):
+    monkeypatch.setattr(server, "cache", ResponseCache(4, 60))
+    monkeypatch.setattr(server, "listener_started", True)
+    etag = cached_page(server.cache, {"page_size": "5"})
+    client = server.app.test_client()
+
+    res = client.get("/api/prices?page_size=5")
+    assert res.status_code == 200
+    assert res.headers["ETag"] == f'"{etag}"'
+
+    res = client.get("/api/prices?page_size=5", headers={"If-None-Match": f'"{etag}"'})
+    assert res.status_code == 304
+    assert res.data == b""
+
+
+def test_asgi_answers_a_matching_etag_with_not_modified(monkeypatch):
+    monkeypatch.setattr(asgi, "cache", ResponseCache(4, 60))
+    etag = cached_page(asgi.cache, {"page_size": "5"})
+
+    def get(headers: list) -> list[dict]:
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "path": "/api/prices",
+            "method": "GET",
+            "query_string": b"page_size=5",
+            "headers": headers,
+        }
+        asyncio.run(asgi.app(scope, None, send))
+
+        return messages
+
+    start, body = get([])
+    assert start["status"] == 200
+    assert (b"etag", f'"{etag}"'.encode()) in start["headers"]
+    assert body["body"] == b'{"prices": []}'
+
+    start, body = get([(b"if-none-match", f'"{etag}"'.encode())])
+    assert start["status"] == 304
+    assert body["body"] == b""
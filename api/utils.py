@@ -1,6 +1,22 @@
 import io
+import re
+import codecs
 import zipfile
 import gzip
+import zlib
+from functools import partial
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterable, Iterator
+
+# size of the chunks streamed through downloads and decompression
+CHUNK_SIZE = 64 * 1024
+# files bigger than this are spooled to disk instead of memory
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# how many entities are held and sent to the database at once
+BATCH_SIZE = 5000
+
+encoding_pattern = re.compile(r"""encoding=["'](.*?)["']""")
 
 
 def unzip(zip_bytes: bytes) -> bytes:
@@ -17,3 +33,79 @@ def unzip(zip_bytes: bytes) -> bytes:
 
 def ungzip(gzip_bytes: bytes) -> bytes:
     return gzip.decompress(gzip_bytes)
+
+
+def read_chunks(stream: IO[bytes]) -> Iterable[bytes]:
+    return iter(partial(stream.read, CHUNK_SIZE), b"")
+
+
+def batched(iterable: Iterable, size: int = BATCH_SIZE) -> Iterator[list]:
+    """Yields lists of `size` consecutive elements of the iterable, the last shorter."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def gzip_compressor():
+    """Returns a zlib compressor which writes the gzip format."""
+    return zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compresses a stream of chunks to a gzip stream, chunk by chunk."""
+    compressor = gzip_compressor()
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+
+    yield compressor.flush()
+
+
+def spooled_file() -> IO[bytes]:
+    """Returns a temporary file kept in memory until it grows past SPOOL_MAX_SIZE."""
+    return SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+
+def spool(chunks: Iterable[bytes]) -> IO[bytes]:
+    """Writes the chunks to a spooled temporary file, returned rewound."""
+    file = spooled_file()
+    for chunk in chunks:
+        file.write(chunk)
+    file.seek(0)
+
+    return file
+
+
+def unzip_stream(stream: IO[bytes]) -> IO[bytes]:
+    """Like `unzip`, but reads from and writes to files chunk by chunk."""
+    with zipfile.ZipFile(stream, "r") as zip:
+        file_name = zip.namelist()[0]  # We only have one file every time
+
+        with zip.open(file_name) as f:
+            return spool(read_chunks(f))
+
+
+def ungzip_stream(stream: IO[bytes]) -> IO[bytes]:
+    """Like `ungzip`, but reads from and writes to files chunk by chunk."""
+    with gzip.GzipFile(fileobj=stream, mode="rb") as f:
+        return spool(read_chunks(f))
+
+
+def transcode_xml(stream: IO[bytes], encoding: str) -> IO[bytes]:
+    """Re-encodes an XML file to UTF-8 chunk by chunk, fixing its declaration.
+    Undecodable bytes are dropped.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+
+    def utf8_chunks():
+        declaration_fixed = False
+        for chunk in read_chunks(stream):
+            text = decoder.decode(chunk)
+            if not declaration_fixed:
+                text = encoding_pattern.sub('encoding="UTF-8"', text, count=1)
+                declaration_fixed = True
+            yield text.encode("utf-8")
+
+        yield decoder.decode(b"", final=True).encode("utf-8")
+
+    return spool(utf8_chunks())
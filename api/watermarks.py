@@ -0,0 +1,57 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+from file_cache import DEFAULT_CACHE_DIRECTORY
+
+
+class Watermarks:
+    """Persisted high-water marks: the newest file time that was processed, per key.
+    Keys are tuples of names, e.g. (server type, chain, category).
+    """
+
+    def __init__(self, path: str = None) -> None:
+        self.path = Path(
+            path
+            or os.environ.get(
+                "ZILAZOL_WATERMARKS", DEFAULT_CACHE_DIRECTORY / "watermarks.json"
+            )
+        )
+        self.lock = Lock()
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.marks = json.load(file)
+        except FileNotFoundError:
+            self.marks = {}
+
+    @staticmethod
+    def key_string(key: tuple) -> str:
+        return "/".join(str(part) for part in key)
+
+    def get(self, key: tuple) -> datetime | None:
+        value = self.marks.get(Watermarks.key_string(key))
+
+        return None if value is None else datetime.fromisoformat(value)
+
+    def set(self, key: tuple, time: datetime):
+        """Advances the mark of the key to `time`. Marks never move backwards."""
+        with self.lock:
+            current = self.get(key)
+            if current is not None and current >= time:
+                return
+
+            self.marks[Watermarks.key_string(key)] = time.isoformat()
+            self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            "w", dir=self.path.parent, delete=False, encoding="utf-8"
+        ) as temp:
+            json.dump(self.marks, temp, indent=4)
+
+        os.replace(temp.name, self.path)
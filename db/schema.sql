@@ -50,7 +50,7 @@ CREATE TABLE IF NOT EXISTS Item (
     manufacture_country VARCHAR(32),
     manufacturer_item_description TEXT,
     unit_quantity UNIT NOT NULL,
-    quantity INT NOT NULL,
+    quantity NUMERIC(10, 3) NOT NULL,
     is_weighted BOOLEAN NOT NULL,
     quantity_in_package INT
 );
@@ -61,10 +61,59 @@ CREATE TABLE IF NOT EXISTS Item_Instance (
     chain_id VARCHAR(16) NOT NULL,
     subchain_id VARCHAR(8) NOT NULL,
     type ITEM_TYPE NOT NULL,
-	price INT NOT NULL,
+	price NUMERIC(8, 2) NOT NULL,
 	allow_discount BOOLEAN NOT NULL,
 
 	PRIMARY KEY (code, store_id, chain_id, subchain_id),
 	FOREIGN KEY (code) REFERENCES Item(code),
 	FOREIGN KEY (store_id, chain_id, subchain_id) REFERENCES Store(id, chain_id, subchain_id)
 );
+
+-- Every price an item instance had, recorded when it changes. Partitioned by
+-- month; the partitions are created and dropped by the loader
+-- (Database.manage_history_partitions), or on the first price change of a month
+-- (Database.record_price_changes). The columns have the types of Item_Instance's,
+-- so the two are joined without casts.
+CREATE TABLE IF NOT EXISTS Price_History (
+    recorded_at TIMESTAMP NOT NULL,
+    price NUMERIC(8, 2) NOT NULL,
+    code VARCHAR(16) NOT NULL,
+    store_id VARCHAR(4) NOT NULL,
+    chain_id VARCHAR(16) NOT NULL,
+    subchain_id VARCHAR(8) NOT NULL
+) PARTITION BY RANGE (recorded_at);
+
+-- rows are appended in time order, so a BRIN index stays tiny
+CREATE INDEX IF NOT EXISTS Price_History_Recorded_At
+ON Price_History USING BRIN (recorded_at);
+CREATE INDEX IF NOT EXISTS Price_History_Item
+ON Price_History (code, chain_id, store_id, recorded_at);
+
+CREATE INDEX IF NOT EXISTS Item_Instance_Code_Price ON Item_Instance (code, price);
+CREATE INDEX IF NOT EXISTS Item_Instance_Store
+ON Item_Instance (chain_id, subchain_id, store_id);
+CREATE INDEX IF NOT EXISTS Store_City ON Store (city);
+
+-- The materialized views are refreshed concurrently after every ingest
+-- (Database.refresh_views), which requires a unique index on each of them.
+CREATE MATERIALIZED VIEW IF NOT EXISTS Cheapest_Item_Store AS
+SELECT DISTINCT ON (code) code, price, chain_id, subchain_id, store_id
+FROM Item_Instance
+ORDER BY code, price, chain_id, subchain_id, store_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS Cheapest_Item_Store_Code
+ON Cheapest_Item_Store (code);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS Chain_Item_Price AS
+SELECT
+    chain_id,
+    code,
+    MIN(price) AS min_price,
+    AVG(price)::NUMERIC(8, 2) AS average_price,
+    COUNT(*) AS store_count
+FROM Item_Instance
+GROUP BY chain_id, code;
+
+CREATE UNIQUE INDEX IF NOT EXISTS Chain_Item_Price_Chain_Code
+ON Chain_Item_Price (chain_id, code);
+CREATE INDEX IF NOT EXISTS Chain_Item_Price_Code ON Chain_Item_Price (code);